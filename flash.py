@@ -6,29 +6,133 @@ import psutil
 import re
 import threading
 import logging
-from typing import List, Dict, Optional, Callable, Tuple, Any
+from typing import List, Dict, Optional, Callable, Tuple, Any, Union
+from collections import OrderedDict
 from dataclasses import dataclass
 import hashlib
+import random
+import select
 import signal
+import socket
 import fcntl
 import struct
 import json
+import mmap
+import queue
 from pathlib import Path
 from enum import Enum, auto
 import tempfile
+import errno
+import xml.etree.ElementTree as ET
+import shutil
+import lzma
+import gzip
+import bz2
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    import requests
+except ImportError:
+    requests = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+_log_handlers = [logging.StreamHandler(sys.stdout)]
+try:
+    _log_handlers.append(logging.FileHandler('/var/log/isoflasher.log'))
+except OSError:
+    # /var/log is only writable by root; log to stdout alone otherwise
+    pass
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('/var/log/isoflasher.log')
-    ]
+    handlers=_log_handlers
 )
 logger = logging.getLogger('ISOFlasher')
 
+# Number of preallocated buffers shared by the reader and writer threads
+PIPELINE_DEPTH = 4
+
+# Default write chunk; small chunks leave the pipeline's per-chunk queue
+# handoffs dominating the copy
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# O_DIRECT transfers must be aligned to the device's logical block size;
+# a page covers every logical block size in common use
+DIRECT_IO_ALIGNMENT = mmap.PAGESIZE
+
+# Block sizes tried by the auto-tune probe, smallest first, and the amount of
+# data each one writes; probing stops once a larger size is no faster
+AUTO_TUNE_CANDIDATES = [64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 8 * 1024 * 1024]
+AUTO_TUNE_PROBE_BYTES = 8 * 1024 * 1024
+
+# Ranged downloads are split into segments of this size; a segment is the
+# unit handed to a connection and the granularity of the resume journal
+DOWNLOAD_SEGMENT_SIZE = 32 * 1024 * 1024
+
+# File extensions accepted as flashable images, raw or compressed
+SUPPORTED_IMAGE_EXTENSIONS = ('.iso', '.img', '.xz', '.gz', '.zst', '.bz2')
+
+# Block device ioctls used on regions a sparse write leaves untouched
+BLKDISCARD = 0x1277
+BLKZEROOUT = 0x127F
+
+# Flushes a block device's buffer cache so read-back comes from the medium
+BLKFLSBUF = 0x1261
+
+# Delta re-flash compares image and device in blocks of this size and logs
+# a running tally of changed and unchanged data every report interval
+DELTA_COMPARE_SIZE = 64 * 1024
+DELTA_REPORT_INTERVAL = 256 * 1024 * 1024
+
+# Verification reads the device (and source) in buffers of this size
+VERIFY_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Sampled verification reads random windows of this size plus the regions
+# that decide whether a stick boots; confidence is reported as the chance of
+# catching damage that affects this fraction of the image
+SAMPLE_WINDOW_SIZE = 1024 * 1024
+SAMPLE_BOOT_REGION_SIZE = 64 * 1024
+SAMPLE_DAMAGE_FRACTION = 0.01
+
+# Mismatching regions are located to this granularity, and verification
+# stops collecting them after this many separate regions
+MISMATCH_GRANULARITY = 512
+MISMATCH_MAX_EXTENTS = 4096
+
+# A flash is fsynced and checkpointed after every interval of written data;
+# a resumed flash re-checks the window just before its checkpoint
+FLASH_CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+RESUME_VERIFY_WINDOW = 16 * 1024 * 1024
+
+# A mapped image is read ahead, and released behind the reader, in windows of this size
+SOURCE_WINDOW_SIZE = 64 * 1024 * 1024
+
+# Kernel-side copies go in slices of this size so progress and cancellation still work
+ZERO_COPY_SLICE = 8 * 1024 * 1024
+# errnos meaning a copy primitive does not support this pair of files
+ZERO_COPY_UNSUPPORTED = (errno.EINVAL, errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF)
+
+# Longest wait for the kernel to drop a device's mounts after umount
+UNMOUNT_TIMEOUT = 10.0
+
+# How long sudo/pkexec get (password prompt included) to start the privileged helper
+HELPER_START_TIMEOUT = 60.0
+HELPER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flash_helper.py")
+
+COMPRESSION_MAGIC = {
+    'xz': b'\xfd7zXZ\x00',
+    'gzip': b'\x1f\x8b',
+    'zstd': b'\x28\xb5\x2f\xfd',
+    'bzip2': b'BZh',
+}
+
 
 class FlashStatus(Enum):
     IDLE = auto()
@@ -39,6 +143,9 @@ class FlashStatus(Enum):
     COMPLETED = auto()
     ERROR = auto()
     CANCELLED = auto()
+    DOWNLOADING = auto()
+    REPAIRING = auto()
+    SYNCING = auto()
 
 
 @dataclass
@@ -60,12 +167,1735 @@ class FlashError(Exception):
     pass
 
 
+def _user_cache_dir() -> Path:
+    """Per-user cache directory for PicoFlasher state"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(str(Path.home()), '.cache')
+    return Path(base) / 'picoflasher'
+
+
+class ChecksumCache:
+    """Persistent SHA-256 cache keyed by file identity
+
+    Entries are keyed on (st_dev, st_ino, st_size, st_mtime_ns), so a file that
+    is replaced or modified simply misses the cache. The store is a small JSON
+    file kept in least-recently-used order and bounded to max_entries. Hits
+    only reorder the entries in memory; the new order is written with the
+    next put or by flush(), which the owner calls when done with the cache
+    (SafeISOFlasher.close() does).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 256):
+        self.path = Path(path) if path else _user_cache_dir() / 'checksums.json'
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    @staticmethod
+    def _key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            for key, entry in data.get('entries', []):
+                self._entries[key] = entry
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            logger.debug(f"Ignoring unreadable checksum cache {self.path}: {e}")
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=str(self.path.parent), prefix='.checksums-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': 1, 'entries': list(self._entries.items())}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.debug(f"Could not write checksum cache {self.path}: {e}")
+
+    def flush(self) -> None:
+        """Write out LRU order changes made by cache hits"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def get(self, file_path: str) -> Optional[str]:
+        """Return the cached checksum for an unchanged file, or None"""
+        try:
+            key = self._key(os.stat(file_path))
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._dirty = True
+            return entry['checksum']
+
+    def put(self, file_path: str, checksum: str, st: Optional[os.stat_result] = None) -> None:
+        """Record a checksum; st should be the stat taken before hashing began"""
+        try:
+            key = self._key(st or os.stat(file_path))
+        except OSError:
+            return
+        with self._lock:
+            self._entries[key] = {'path': os.path.abspath(file_path), 'checksum': checksum}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def invalidate(self, file_path: str) -> int:
+        """Drop every entry recorded for a path and return how many were removed"""
+        abs_path = os.path.abspath(file_path)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.get('path') == abs_path]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._save()
+            return len(stale)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+
+class FlashJournal:
+    """Persistent record of how far each in-progress flash has safely got
+
+    One entry per target device holds the image and device identity plus the
+    last offset known to be on stable storage. The file is rewritten
+    atomically and fsynced at every checkpoint so it survives a crash.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else _user_cache_dir() / 'flash-journal.json'
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                self._entries = dict(json.load(f).get('entries', {}))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.debug(f"Ignoring unreadable flash journal {self.path}: {e}")
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=str(self.path.parent), prefix='.flash-journal-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': 1, 'entries': self._entries}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.debug(f"Could not write flash journal {self.path}: {e}")
+
+    def get(self, device: str) -> Optional[Dict[str, Any]]:
+        """Return the checkpoint recorded for a device, or None"""
+        with self._lock:
+            entry = self._entries.get(device)
+            return dict(entry) if entry else None
+
+    def record(self, device: str, identity: Dict[str, Any], offset: int) -> None:
+        """Record that everything below offset has reached the device"""
+        with self._lock:
+            self._entries[device] = dict(identity, offset=offset, updated=time.time())
+            self._save()
+
+    def clear(self, device: str) -> None:
+        """Forget the checkpoint for a device"""
+        with self._lock:
+            if self._entries.pop(device, None) is not None:
+                self._save()
+
+
+class RangedDownloader:
+    """Download a URL over several concurrent HTTP range requests
+
+    The target file is preallocated as a sparse file and each segment is
+    written in place with pwrite. Progress is recorded in a small journal
+    next to the file (``<dest>.journal``), so an interrupted download resumes
+    where it left off as long as the remote size and validators are unchanged.
+    Servers without range support fall back to a single streamed request.
+    """
+
+    def __init__(self, session, connections: int = 4, segment_size: int = DOWNLOAD_SEGMENT_SIZE,
+                 chunk_size: int = 1024 * 1024, timeout: float = 30.0,
+                 stop_event: Optional[threading.Event] = None,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 journal_interval: float = 2.0):
+        self.session = session
+        self.connections = max(1, connections)
+        self.segment_size = segment_size
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.journal_interval = journal_interval
+        self._stop_event = stop_event or threading.Event()
+        self._on_progress = on_progress
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._done = {}
+        self._downloaded = 0
+        self._last_journal = 0.0
+        self.resumed = False
+
+    def _probe(self, url: str) -> Dict[str, Any]:
+        """Find the remote size, range support and cache validators"""
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout,
+                                     headers={"Accept-Encoding": "identity"})
+        response.raise_for_status()
+        length = response.headers.get("Content-Length", "")
+        return {
+            "url": url,
+            "size": int(length) if length.isdigit() else 0,
+            "ranges": response.headers.get("Accept-Ranges", "").lower() == "bytes",
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+        }
+
+    def _load_journal(self, journal_path: str, remote: Dict[str, Any]) -> Dict[int, int]:
+        try:
+            with open(journal_path, 'r') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        for key in ("url", "size", "etag", "last_modified"):
+            if journal.get(key) != remote[key]:
+                return {}
+        if journal.get("segment_size") != self.segment_size:
+            return {}
+        return {int(index): done for index, done in journal.get("done", {}).items()}
+
+    def _save_journal(self, journal_path: str, remote: Dict[str, Any], fd: int) -> None:
+        with self._journal_lock:
+            with self._lock:
+                done = dict(self._done)
+            # Data must be durable before the journal claims it
+            os.fdatasync(fd)
+            tmp_path = f"{journal_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    "url": remote["url"], "size": remote["size"], "etag": remote["etag"],
+                    "last_modified": remote["last_modified"], "segment_size": self.segment_size,
+                    "done": done
+                }, f)
+            os.replace(tmp_path, journal_path)
+
+    def _advance(self, index: int, n: int, journal_path: str, remote: Dict[str, Any], fd: int) -> None:
+        with self._lock:
+            self._done[index] = self._done.get(index, 0) + n
+            self._downloaded += n
+            downloaded = self._downloaded
+            now = time.monotonic()
+            save = now - self._last_journal >= self.journal_interval
+            if save:
+                self._last_journal = now
+        if save:
+            self._save_journal(journal_path, remote, fd)
+        if self._on_progress:
+            self._on_progress(downloaded, remote["size"])
+
+    def _fetch_segment(self, url: str, index: int, fd: int, journal_path: str,
+                       remote: Dict[str, Any]) -> None:
+        start = index * self.segment_size
+        end = min(start + self.segment_size, remote["size"])
+        offset = start + self._done.get(index, 0)
+        if offset >= end:
+            return
+        headers = {"Range": f"bytes={offset}-{end - 1}", "Accept-Encoding": "identity"}
+        with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise FlashError(f"Server ignored range request for bytes {offset}-{end - 1}")
+            # Let a body cut short read as EOF so it is reported below; newer urllib3 raises instead
+            response.raw.enforce_content_length = False
+            buf = bytearray(self.chunk_size)
+            with memoryview(buf) as view:
+                while offset < end:
+                    if self._stop_event.is_set():
+                        return
+                    n = response.raw.readinto(view[:min(self.chunk_size, end - offset)])
+                    if not n:
+                        raise FlashError(f"Connection closed at byte {offset} of segment {index}")
+                    written = os.pwrite(fd, view[:n], offset)
+                    offset += written
+                    self._advance(index, written, journal_path, remote, fd)
+
+    def _download_single(self, url: str, dest_path: str, remote: Dict[str, Any]) -> int:
+        """Plain streamed download for servers without range support"""
+        downloaded = 0
+        with self.session.get(url, stream=True, timeout=self.timeout,
+                              headers={"Accept-Encoding": "identity"}) as response:
+            response.raise_for_status()
+            with open(dest_path, 'wb') as f:
+                buf = bytearray(self.chunk_size)
+                with memoryview(buf) as view:
+                    while not self._stop_event.is_set():
+                        n = response.raw.readinto(view)
+                        if not n:
+                            break
+                        f.write(view[:n])
+                        downloaded += n
+                        if self._on_progress:
+                            self._on_progress(downloaded, remote["size"])
+                f.flush()
+                os.fsync(f.fileno())
+        return downloaded
+
+    def download(self, url: str, dest_path: str) -> int:
+        """Download url to dest_path and return its size in bytes"""
+        remote = self._probe(url)
+        if not remote["ranges"] or not remote["size"]:
+            logger.info("Server does not support range requests, downloading in one stream")
+            return self._download_single(url, dest_path, remote)
+        
+        journal_path = f"{dest_path}.journal"
+        done = self._load_journal(journal_path, remote) if os.path.exists(dest_path) else {}
+        self.resumed = bool(done)
+        self._done = done
+        self._downloaded = sum(done.values())
+        segments = [
+            index for index in range((remote["size"] + self.segment_size - 1) // self.segment_size)
+            if done.get(index, 0) < min(self.segment_size, remote["size"] - index * self.segment_size)
+        ]
+        
+        fd = os.open(dest_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # A sparse preallocation; segments are filled in with pwrite
+            os.ftruncate(fd, remote["size"])
+            self._save_journal(journal_path, remote, fd)
+            with ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="download") as pool:
+                futures = [
+                    pool.submit(self._fetch_segment, url, index, fd, journal_path, remote)
+                    for index in segments
+                ]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    self._stop_event.set()
+                    raise
+                finally:
+                    self._save_journal(journal_path, remote, fd)
+            if self._stop_event.is_set():
+                return self._downloaded
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        os.unlink(journal_path)
+        return remote["size"]
+
+
+def detect_compression(header: bytes) -> str:
+    """Identify a compressed image by its magic bytes, or return '' for raw images"""
+    for name, magic in COMPRESSION_MAGIC.items():
+        if header.startswith(magic):
+            return name
+    return ""
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decode an xz multibyte integer, returning (value, next position)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _xz_uncompressed_size(f) -> Optional[int]:
+    """Sum the uncompressed sizes recorded in every xz stream index"""
+    pos = f.seek(0, os.SEEK_END)
+    total = 0
+    while pos > 0:
+        # Streams may be followed by padding in multiples of four null bytes
+        while pos >= 4:
+            f.seek(pos - 4)
+            if f.read(4) != b'\x00\x00\x00\x00':
+                break
+            pos -= 4
+        if pos < 24:
+            return None
+        f.seek(pos - 12)
+        footer = f.read(12)
+        if footer[10:12] != b'YZ':
+            return None
+        index_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+        index_start = pos - 12 - index_size
+        if index_start < 12:
+            return None
+        f.seek(index_start)
+        index = f.read(index_size)
+        if index[0] != 0:
+            return None
+        count, p = _read_varint(index, 1)
+        blocks_size = 0
+        for _ in range(count):
+            unpadded, p = _read_varint(index, p)
+            uncompressed, p = _read_varint(index, p)
+            blocks_size += (unpadded + 3) // 4 * 4
+            total += uncompressed
+        pos = index_start - blocks_size - 12
+    return total if pos == 0 else None
+
+
+def _zstd_uncompressed_size(f) -> Optional[int]:
+    """Sum the content sizes of every zstd frame, or None if any frame omits it"""
+    end = f.seek(0, os.SEEK_END)
+    pos = 0
+    total = 0
+    while pos < end:
+        f.seek(pos)
+        header = f.read(18)
+        if len(header) < 5:
+            return None
+        magic = struct.unpack('<I', header[:4])[0]
+        if magic & 0xFFFFFFF0 == 0x184D2A50:
+            # Skippable frame
+            if len(header) < 8:
+                return None
+            pos += 8 + struct.unpack('<I', header[4:8])[0]
+            continue
+        if magic != 0xFD2FB528:
+            return None
+        descriptor = header[4]
+        fcs_flag = descriptor >> 6
+        single_segment = (descriptor >> 5) & 1
+        has_checksum = (descriptor >> 2) & 1
+        dict_id_size = (0, 1, 2, 4)[descriptor & 3]
+        fcs_size = (1 if single_segment else 0, 2, 4, 8)[fcs_flag]
+        if not fcs_size:
+            return None
+        field = 5 + (0 if single_segment else 1) + dict_id_size
+        if len(header) < field + fcs_size:
+            return None
+        size = int.from_bytes(header[field:field + fcs_size], 'little')
+        total += size + 256 if fcs_size == 2 else size
+        
+        # Walk the block headers to find the next frame
+        pos += field + fcs_size
+        while True:
+            f.seek(pos)
+            raw = f.read(3)
+            if len(raw) < 3:
+                # Truncated, e.g. a download that stopped part way
+                return None
+            block = int.from_bytes(raw, 'little')
+            block_type = (block >> 1) & 3
+            pos += 3 + (1 if block_type == 1 else block >> 3)
+            if pos > end:
+                return None
+            if block & 1:
+                break
+        pos += 4 if has_checksum else 0
+    if pos > end:
+        return None
+    return total
+
+
+def image_uncompressed_size(path: str, compression: str) -> Optional[int]:
+    """Uncompressed size from container metadata, or None when it is not recorded
+
+    gzip only stores the size modulo 4 GiB and bzip2 not at all, so both
+    report None.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if compression == 'xz':
+                return _xz_uncompressed_size(f)
+            if compression == 'zstd':
+                return _zstd_uncompressed_size(f)
+    except (OSError, IndexError, struct.error) as e:
+        logger.debug(f"Cannot read uncompressed size of {path}: {e}")
+    return None
+
+
+class _DecompressingReader:
+    """Readable stream of a compressed image's decompressed contents
+
+    An external decompressor is preferred because it runs in its own process
+    (often multi-threaded) instead of competing with the write pipeline for
+    the GIL; the in-process codecs are the fallback.
+    """
+
+    TOOLS = {
+        'xz': [['xz', '-dc', '-T0']],
+        'zstd': [['zstd', '-dcq']],
+        'gzip': [['pigz', '-dc'], ['gzip', '-dc']],
+        'bzip2': [['lbzip2', '-dc'], ['pbzip2', '-dc'], ['bzip2', '-dc']],
+    }
+
+    def __init__(self, path: str, compression: str):
+        self.compression = compression
+        self._process = None
+        self._file = None
+        for cmd in self.TOOLS[compression]:
+            if shutil.which(cmd[0]):
+                self._process = subprocess.Popen(cmd + [path], stdout=subprocess.PIPE,
+                                                 stderr=subprocess.PIPE, bufsize=0)
+                self._stream = self._process.stdout
+                return
+        
+        if compression == 'xz':
+            self._stream = lzma.open(path, 'rb')
+        elif compression == 'gzip':
+            self._stream = gzip.open(path, 'rb')
+        elif compression == 'bzip2':
+            self._stream = bz2.open(path, 'rb')
+        elif zstandard is not None:
+            self._file = open(path, 'rb')
+            self._stream = zstandard.ZstdDecompressor().stream_reader(self._file)
+        else:
+            raise FlashError("zstd images need the zstd tool or the zstandard package")
+
+    def readinto(self, view: memoryview) -> int:
+        n = self._stream.readinto(view)
+        if not n and self._process:
+            # EOF on the pipe; a failed decompressor must not look like a short image
+            if self._process.wait() != 0:
+                stderr = self._process.stderr.read().decode(errors='replace').strip()
+                raise FlashError(f"{self.compression} decompression failed: {stderr}")
+        return n
+
+    def close(self) -> None:
+        self._stream.close()
+        if self._file:
+            self._file.close()
+        if self._process:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            self._process.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@dataclass
+class ImageBmap:
+    """Block map of an image: which ranges hold data and their checksums"""
+    image_size: int
+    block_size: int
+    checksum_type: str
+    # (offset, length, checksum) per mapped range, in bytes
+    ranges: List[Tuple[int, int, str]]
+
+
+def find_bmap(image_path: str) -> Optional[str]:
+    """Locate a .bmap file next to an image, bmaptool style"""
+    base = image_path
+    for ext in ('.xz', '.gz', '.zst', '.bz2'):
+        if base.lower().endswith(ext):
+            base = base[:-len(ext)]
+            break
+    candidates = [f"{image_path}.bmap", f"{base}.bmap", f"{os.path.splitext(base)[0]}.bmap"]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def parse_bmap(bmap_path: str) -> ImageBmap:
+    """Parse a bmaptool block map (format 1.x or 2.x)"""
+    with open(bmap_path, 'rb') as f:
+        raw = f.read()
+    root = ET.fromstring(raw)
+    if root.tag != 'bmap':
+        raise FlashError(f"Not a bmap file: {bmap_path}")
+    
+    major = int(root.get('version', '1.0').split('.')[0])
+    checksum_type = (root.findtext('ChecksumType') or ('sha1' if major < 2 else 'sha256')).strip()
+    
+    file_checksum = (root.findtext('BmapFileChecksum') or root.findtext('BmapFileSHA1') or '').strip()
+    if file_checksum:
+        # The file checksum is taken with its own value replaced by zeros
+        zeroed = raw.replace(file_checksum.encode(), b'0' * len(file_checksum), 1)
+        if hashlib.new(checksum_type, zeroed).hexdigest() != file_checksum:
+            raise FlashError(f"bmap file is corrupted: {bmap_path}")
+    
+    image_size = int(root.findtext('ImageSize').strip())
+    block_size = int(root.findtext('BlockSize').strip())
+    ranges = []
+    for node in root.find('BlockMap').findall('Range'):
+        first, _, last = node.text.strip().partition('-')
+        start = int(first) * block_size
+        end = min((int(last or first) + 1) * block_size, image_size)
+        checksum = node.get('chksum') or node.get('sha1') or ''
+        ranges.append((start, end - start, checksum))
+    return ImageBmap(image_size, block_size, checksum_type, ranges)
+
+
+def _file_data_extents(fd: int, size: int) -> List[Tuple[int, int]]:
+    """Data extents of a file found with SEEK_DATA/SEEK_HOLE"""
+    extents = []
+    pos = 0
+    try:
+        while pos < size:
+            try:
+                start = os.lseek(fd, pos, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break
+                raise
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            extents.append((start, end - start))
+            pos = end
+    except (OSError, AttributeError):
+        # No hole support: treat the whole file as data
+        extents = [(0, size)]
+    os.lseek(fd, 0, os.SEEK_SET)
+    return extents
+
+
+class _ExtentReader:
+    """Read only the mapped extents of an image stream
+
+    readinto returns at most one contiguous run and ``offset`` gives where
+    that run belongs in the image. Unmapped data is skipped with seek when
+    the source allows it and read past otherwise (compressed streams). Per
+    extent checksums, when given, are verified as the data streams past.
+    """
+
+    def __init__(self, src, extents: List[Tuple[int, int]], checksums: Optional[List[str]] = None,
+                 checksum_type: str = 'sha256'):
+        self._src = src
+        self._extents = extents
+        self._checksums = checksums
+        self._checksum_type = checksum_type
+        self._index = 0
+        self._pos = 0
+        self._hash = None
+        self.offset = 0
+        try:
+            self._seekable = src.seekable()
+        except AttributeError:
+            self._seekable = False
+
+    def _skip(self, count: int) -> None:
+        if self._seekable:
+            self._src.seek(count, os.SEEK_CUR)
+            self._pos += count
+            return
+        scratch = bytearray(min(count, 1024 * 1024))
+        with memoryview(scratch) as view:
+            while count:
+                n = self._src.readinto(view[:min(count, len(view))])
+                if not n:
+                    raise FlashError(f"Image ended at byte {self._pos}, before its mapped data")
+                count -= n
+                self._pos += n
+
+    def _finish_extent(self) -> None:
+        if self._checksums and self._checksums[self._index]:
+            start, length = self._extents[self._index]
+            if self._hash.hexdigest() != self._checksums[self._index]:
+                raise FlashError(f"bmap checksum mismatch for bytes {start}-{start + length - 1}")
+        self._hash = None
+        self._index += 1
+
+    def readinto(self, view: memoryview) -> int:
+        while self._index < len(self._extents):
+            start, length = self._extents[self._index]
+            end = start + length
+            if self._pos >= end:
+                self._finish_extent()
+                continue
+            if self._pos < start:
+                self._skip(start - self._pos)
+                continue
+            
+            want = min(len(view), end - self._pos)
+            filled = 0
+            while filled < want:
+                n = self._src.readinto(view[filled:want])
+                if not n:
+                    raise FlashError(f"Image ended at byte {self._pos + filled}, before its mapped data")
+                filled += n
+            if self._checksums:
+                if self._hash is None:
+                    self._hash = hashlib.new(self._checksum_type)
+                self._hash.update(view[:filled])
+            self.offset = self._pos
+            self._pos += filled
+            return filled
+        return 0
+
+
+class _MappedSource:
+    """Read-only memory map of an image file that lends out its memory
+
+    view(), chunks() and read_view() return memoryview slices of the mapping,
+    so hashing, writing and comparing take the data without a copy or an
+    allocation per chunk. readinto, seek, tell and fileno make it a drop-in
+    for a raw file object everywhere else.
+
+    The mapping is advised MADV_SEQUENTIAL; the window ahead of the reader is
+    advised MADV_WILLNEED and consumed windows MADV_DONTNEED (release()), so
+    resident memory stays bounded by a few SOURCE_WINDOW_SIZE whatever the
+    image size.
+    """
+
+    def __init__(self, path: str, window: int = SOURCE_WINDOW_SIZE):
+        self._file = open(path, 'rb', buffering=0)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._view = memoryview(self._map) if self._map is not None else memoryview(b'')
+        self._window = window
+        self._pos = 0
+        self._released = 0
+        self._lock = threading.Lock()
+        self._advise('MADV_SEQUENTIAL', 0, self.size)
+        self._advise('MADV_WILLNEED', 0, window)
+
+    def _advise(self, option: str, start: int, length: int) -> None:
+        if self._map is None or not hasattr(mmap, option):
+            return
+        start -= start % mmap.PAGESIZE
+        length = min(length, self.size - start)
+        if length > 0:
+            try:
+                self._map.madvise(getattr(mmap, option), start, length)
+            except OSError:
+                pass
+
+    def release(self, upto: int) -> None:
+        """Drop the pages before upto once a window's worth is consumed, and read ahead"""
+        with self._lock:
+            if upto - self._released < self._window and upto < self.size:
+                return
+            end = upto - upto % mmap.PAGESIZE
+            if end > self._released:
+                self._advise('MADV_DONTNEED', self._released, end - self._released)
+                self._released = end
+        self._advise('MADV_WILLNEED', upto, self._window)
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """The image bytes [offset, offset + length), cut short at the end of the file"""
+        return self._view[offset:min(offset + length, self.size)]
+
+    def chunks(self, chunk_size: int):
+        """Yield the whole image as consecutive views, releasing each after use"""
+        for offset in range(0, self.size, chunk_size):
+            yield self.view(offset, chunk_size)
+            self.release(offset + chunk_size)
+
+    def read_view(self, length: int) -> memoryview:
+        """Like read(), but returns a view of the mapping"""
+        view = self.view(self._pos, length)
+        self._pos += len(view)
+        return view
+
+    def readinto(self, view: memoryview) -> int:
+        n = max(0, min(len(view), self.size - self._pos))
+        view[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        self.release(self._pos)
+        return n
+
+    def read(self, length: int = -1) -> bytes:
+        if length < 0:
+            length = self.size
+        return bytes(self.read_view(length))
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seekable(self) -> bool:
+        return True
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def close(self) -> None:
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A consumer still holds a view; the mapping goes when it does
+                pass
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _sha256_file(path: str) -> str:
+    """SHA-256 of a file, hashed straight from its mapping"""
+    sha256_hash = hashlib.sha256()
+    with _MappedSource(path) as source:
+        for view in source.chunks(VERIFY_BLOCK_SIZE):
+            sha256_hash.update(view)
+    return sha256_hash.hexdigest()
+
+
+class _DeltaWriter:
+    """Pipeline writer that only writes the parts of a chunk the device lacks
+
+    wrap() hooks the pipeline's source so the matching device range is read
+    on a worker thread as soon as a chunk has been read from the image; by
+    the time the writer gets the chunk, the device's copy is usually already
+    in memory. Differing DELTA_COMPARE_SIZE blocks are written as
+    contiguous runs with write(offset, view).
+    """
+
+    def __init__(self, read_fd: int, write: Callable[[int, memoryview], None],
+                 on_report: Optional[Callable[[int, int], None]] = None):
+        self.read_fd = read_fd
+        self._write = write
+        self._on_report = on_report
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._reads = queue.Queue()
+        self._next = 0
+        self._last_report = 0
+        self.bytes_changed = 0
+        self.bytes_unchanged = 0
+
+    def wrap(self, read_into: Callable[[memoryview], int],
+             locate: Optional[Callable[[], int]] = None) -> Callable[[memoryview], int]:
+        def read(view: memoryview) -> int:
+            n = read_into(view)
+            if n:
+                offset = locate() if locate else self._next
+                self._next = offset + n
+                self._reads.put((n, self._executor.submit(os.pread, self.read_fd, n, offset)))
+            return n
+        return read
+
+    def _device_data(self, length: int) -> bytes:
+        """Collect the prefetched device reads covering the next chunk"""
+        parts = []
+        got = 0
+        while got < length:
+            n, future = self._reads.get()
+            parts.append(future.result())
+            got += n
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def __call__(self, offset: int, view: memoryview) -> None:
+        old = self._device_data(len(view))
+        if bytes(view) == old:
+            self.bytes_unchanged += len(view)
+        else:
+            run_start = None
+            for pos in range(0, len(view), DELTA_COMPARE_SIZE):
+                end = min(pos + DELTA_COMPARE_SIZE, len(view))
+                if bytes(view[pos:end]) == old[pos:end]:
+                    self.bytes_unchanged += end - pos
+                    if run_start is not None:
+                        self._write(offset + run_start, view[run_start:pos])
+                        run_start = None
+                else:
+                    self.bytes_changed += end - pos
+                    if run_start is None:
+                        run_start = pos
+            if run_start is not None:
+                self._write(offset + run_start, view[run_start:])
+        
+        total = self.bytes_changed + self.bytes_unchanged
+        if self._on_report and total - self._last_report >= DELTA_REPORT_INTERVAL:
+            self._last_report = total
+            self._on_report(self.bytes_changed, self.bytes_unchanged)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class _ResumableWriter:
+    """Pipeline writer that skips data committed by an earlier run and checkpoints
+
+    Chunks wholly below resume_from minus RESUME_VERIFY_WINDOW are skipped;
+    chunks in the window are compared with the device and rewritten only if
+    they differ. Every checkpoint interval the device is fsynced and
+    on_commit receives the offset everything before it has reached.
+    wrap() puts it in front of the pipeline's real writer.
+    """
+
+    def __init__(self, dest_fd: int, read_fd: Optional[int] = None, resume_from: int = 0,
+                 on_commit: Optional[Callable[[int], None]] = None,
+                 interval: int = FLASH_CHECKPOINT_INTERVAL):
+        self._write = None
+        self._dest_fd = dest_fd
+        self.read_fd = read_fd
+        self.resume_from = resume_from if read_fd is not None else 0
+        self._window_start = max(0, self.resume_from - RESUME_VERIFY_WINDOW)
+        self._on_commit = on_commit
+        self._interval = interval
+        self._committed = self.resume_from
+        self.window_mismatch = False
+
+    def wrap(self, write: Callable[[int, memoryview], None]) -> Callable[[int, memoryview], None]:
+        self._write = write
+        return self
+
+    def __call__(self, offset: int, view: memoryview) -> None:
+        end = offset + len(view)
+        if offset < self.resume_from:
+            if end <= self._window_start:
+                return
+            if bytes(view) == os.pread(self.read_fd, len(view), offset):
+                return
+            if end <= self.resume_from:
+                self.window_mismatch = True
+        self._write(offset, view)
+        
+        if self._on_commit and end - self._committed >= self._interval:
+            os.fsync(self._dest_fd)
+            self._committed = end
+            self._on_commit(end)
+
+
+class _BufferRing:
+    """Fixed pool of preallocated buffers recycled between reader and writer"""
+
+    def __init__(self, count: int, size: int, aligned: bool = False):
+        self.size = size
+        self._free = queue.Queue()
+        self._buffers = []
+        for _ in range(count):
+            # Anonymous mappings are page aligned, which O_DIRECT requires
+            buf = mmap.mmap(-1, size) if aligned else bytearray(size)
+            self._buffers.append(buf)
+            self._free.put(buf)
+
+    def acquire(self, timeout: Optional[float] = None) -> bytearray:
+        """Take a free buffer, blocking until one is returned"""
+        return self._free.get(timeout=timeout)
+
+    def release(self, buf: bytearray) -> None:
+        """Return a buffer to the pool"""
+        self._free.put(buf)
+
+    def close(self) -> None:
+        """Unmap any mmap-backed buffers"""
+        for buf in self._buffers:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+        self._buffers = []
+
+
+class _WritePipeline:
+    """Overlap source reads and device writes using a reader and a writer thread
+
+    The reader fills ring buffers with ``read_into`` and hands them to the writer
+    through a bounded queue, so a slow device applies backpressure to the reader
+    instead of growing memory use. Observers (e.g. a running hash) see every
+    chunk on threads of their own; a buffer returns to the ring once the writer
+    and all observers are done with it.
+
+    ``write`` may be a list of writers to fan one read out to several devices.
+    With isolate_errors a failing writer is dropped and recorded in
+    writer_errors while the others carry on; the pipeline only aborts once
+    every writer has failed.
+
+    By default chunks are numbered by their position in the stream. A source
+    that skips data (e.g. unmapped regions of a sparse image) passes locate,
+    which returns the image offset of the last read; such a source returns
+    at most one contiguous run per read.
+
+    A source that can lend out its own memory (see _MappedSource) passes
+    read_view instead of filling ring buffers: chunks are then views of the
+    source itself, and release_view gets the end offset of each chunk once
+    every consumer is done with it. The queues still bound how far the
+    reader runs ahead.
+    """
+
+    def __init__(self, read_into: Callable[[memoryview], int],
+                 write, block_size: int,
+                 depth: int = PIPELINE_DEPTH, stop_event: Optional[threading.Event] = None,
+                 on_progress: Optional[Callable[[int], None]] = None, aligned: bool = False,
+                 observers: Tuple[Callable[[int, memoryview], None], ...] = (),
+                 isolate_errors: bool = False, locate: Optional[Callable[[], int]] = None,
+                 read_view: Optional[Callable[[int], memoryview]] = None,
+                 release_view: Optional[Callable[[int], None]] = None):
+        self._read_into = read_into
+        self._read_view = read_view
+        self._release_view = release_view
+        self._block_size = block_size
+        self._locate = locate
+        writers = list(write) if isinstance(write, (list, tuple)) else [write]
+        self._writer_count = len(writers)
+        self._consumers = writers + list(observers)
+        self._queues = [queue.Queue(maxsize=depth) for _ in self._consumers]
+        self._isolate_errors = isolate_errors
+        self.writer_errors = {}
+        self._ring = _BufferRing(depth if read_view is None else 0, block_size, aligned=aligned)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._stop_event = stop_event or threading.Event()
+        self._abort = threading.Event()
+        self._on_progress = on_progress
+        self._errors = []
+        self.bytes_written = 0
+
+    def _stopping(self) -> bool:
+        return self._abort.is_set() or self._stop_event.is_set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self, view: memoryview) -> int:
+        """Fill a buffer completely unless the source hits EOF"""
+        filled = 0
+        while filled < len(view):
+            n = self._read_into(view[filled:])
+            if not n:
+                break
+            filled += n
+        return filled
+
+    def _reader(self) -> None:
+        offset = 0
+        try:
+            while not self._stopping():
+                if self._read_view is not None:
+                    buf = self._read_view(self._block_size)
+                    n = len(buf)
+                    if not n:
+                        break
+                else:
+                    try:
+                        buf = self._ring.acquire(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    with memoryview(buf) as view:
+                        n = self._read_into(view) if self._locate else self._fill(view)
+                    if not n:
+                        self._ring.release(buf)
+                        break
+                if self._locate:
+                    offset = self._locate()
+                with self._pending_lock:
+                    self._pending[id(buf)] = len(self._queues)
+                if not all(self._put(q, (offset, buf, n)) for q in self._queues):
+                    break
+                offset += n
+        except BaseException as e:
+            self._errors.append(e)
+            self._abort.set()
+        finally:
+            for q in self._queues:
+                self._put(q, None)
+
+    def _done(self, buf, end: int) -> None:
+        """Drop one consumer's claim on a buffer, recycling it after the last"""
+        with self._pending_lock:
+            self._pending[id(buf)] -= 1
+            last = self._pending[id(buf)] == 0
+            if last:
+                del self._pending[id(buf)]
+        if not last:
+            return
+        if self._read_view is None:
+            self._ring.release(buf)
+        elif self._release_view:
+            self._release_view(end)
+
+    def _writer_failed(self, index: int, error: BaseException) -> None:
+        """Drop a writer, aborting the pipeline once no writer is left"""
+        with self._pending_lock:
+            self.writer_errors[index] = error
+            all_failed = len(self.writer_errors) == self._writer_count
+        if all_failed:
+            self._errors.append(error)
+            self._abort.set()
+
+    def _consumer(self, index: int) -> None:
+        consume = self._consumers[index]
+        q = self._queues[index]
+        failed = False
+        while not self._abort.is_set():
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            if self._stop_event.is_set():
+                self._abort.set()
+                break
+            offset, buf, n = item
+            try:
+                # A dropped writer keeps draining its queue so buffers recycle
+                if not failed:
+                    with memoryview(buf) as view:
+                        consume(offset, view[:n])
+            except BaseException as e:
+                if not (self._isolate_errors and index < self._writer_count):
+                    self._errors.append(e)
+                    self._abort.set()
+                    break
+                failed = True
+                self._writer_failed(index, e)
+            finally:
+                self._done(buf, offset + n)
+            if index == 0 and not failed:
+                self.bytes_written += n
+                if self._on_progress:
+                    self._on_progress(self.bytes_written)
+
+    def run(self) -> int:
+        """Run the pipeline to completion and return the number of bytes written"""
+        threads = [threading.Thread(target=self._reader, name="flash-reader", daemon=True)]
+        threads.extend(
+            threading.Thread(target=self._consumer, args=(i,), name=f"flash-consumer-{i}", daemon=True)
+            for i in range(len(self._consumers))
+        )
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self._ring.close()
+        if self._errors:
+            raise self._errors[0]
+        return self.bytes_written
+
+
+def _write_all(fd: int, data: memoryview, offset: Optional[int] = None) -> None:
+    """Write a whole buffer to a file descriptor, retrying short writes
+
+    With an offset the data is written there with pwrite instead of at the
+    current file position.
+    """
+    while data:
+        if offset is None:
+            written = os.write(fd, data)
+        else:
+            written = os.pwrite(fd, data, offset)
+            offset += written
+        data = data[written:]
+
+
+def _direct_write(fd: int, data: memoryview, offset: Optional[int] = None) -> None:
+    """Write to an O_DIRECT descriptor, dropping O_DIRECT for an unaligned tail"""
+    if len(data) % DIRECT_IO_ALIGNMENT:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+    _write_all(fd, data, offset)
+
+
+def _write_zeros(fd: int, offset: int, length: int, chunk_size: int = 1024 * 1024) -> None:
+    """Write length zero bytes at offset, dropping O_DIRECT since the range may be unaligned"""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    if flags & getattr(os, 'O_DIRECT', 0):
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+    zeros = bytes(min(chunk_size, length))
+    with memoryview(zeros) as view:
+        while length:
+            n = min(len(view), length)
+            _write_all(fd, view[:n], offset)
+            offset += n
+            length -= n
+
+
+def _align_up(value: int, alignment: int) -> int:
+    """Round value up to the next multiple of alignment"""
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _pread_full(fd: int, view: memoryview, offset: int) -> int:
+    """Read into a whole buffer at offset, stopping early only at end of file"""
+    filled = 0
+    while filled < len(view):
+        n = os.preadv(fd, [view[filled:]], offset + filled)
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def _read_full(src, view: memoryview) -> int:
+    """Fill a buffer from a stream, stopping early only at end of stream"""
+    filled = 0
+    while filled < len(view):
+        n = src.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def _diff_extents(a: memoryview, b: memoryview, granularity: int) -> List[Tuple[int, int]]:
+    """Differing regions of two buffers as (start, length), found by bisection
+
+    Halves that compare equal are dropped whole, so only the differing parts
+    are narrowed down, to granularity bytes. Bytes past the end of the
+    shorter buffer count as different.
+    """
+    length = min(len(a), len(b))
+    found = []
+    pending = [(0, length)] if length else []
+    while pending:
+        lo, hi = pending.pop()
+        if bytes(a[lo:hi]) == bytes(b[lo:hi]):
+            continue
+        if hi - lo <= granularity:
+            found.append((lo, hi - lo))
+            continue
+        mid = lo + max(granularity, (hi - lo) // 2 // granularity * granularity)
+        pending.append((mid, hi))
+        pending.append((lo, mid))
+    if len(a) != len(b):
+        found.append((length, abs(len(a) - len(b))))
+    return _merge_extents(found)
+
+
+def _merge_extents(extents: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sort extents and merge the ones that overlap or touch"""
+    merged = []
+    for start, length in sorted(e for e in extents if e[1] > 0):
+        if merged and start <= merged[-1][0] + merged[-1][1]:
+            last_start, last_length = merged[-1]
+            merged[-1] = (last_start, max(last_length, start + length - last_start))
+        else:
+            merged.append((start, length))
+    return merged
+
+
+def _intersect_extents(a: List[Tuple[int, int]], b: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Ranges covered by both of two sorted, non-overlapping extent lists"""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][0] + a[i][1], b[j][0] + b[j][1])
+        if start < end:
+            result.append((start, end - start))
+        if a[i][0] + a[i][1] < b[j][0] + b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def image_boot_regions(fd: int, image_size: int) -> List[Tuple[int, int]]:
+    """Ranges of an image holding partition tables and boot sectors
+
+    Covers the first and last MiB (MBR, primary and backup GPT, the ISO 9660
+    system area and volume descriptors), the start of every MBR and GPT
+    partition, and the El Torito boot catalog and boot images.
+    """
+    regions = [(0, 1024 * 1024), (max(0, image_size - 1024 * 1024), 1024 * 1024)]
+    head = os.pread(fd, 64 * 1024, 0)
+    
+    if head[510:512] == b'\x55\xaa':
+        for i in range(4):
+            entry = head[446 + 16 * i:462 + 16 * i]
+            start_lba = struct.unpack_from('<I', entry, 8)[0]
+            if entry[4] and start_lba:
+                regions.append((start_lba * 512, SAMPLE_BOOT_REGION_SIZE))
+    
+    for sector_size in (512, 4096):
+        if head[sector_size:sector_size + 8] != b'EFI PART':
+            continue
+        entries_lba, count, entry_size = struct.unpack_from('<QII', head, sector_size + 72)
+        if not 0 < entry_size <= 4096:
+            break
+        table = os.pread(fd, min(count, 256) * entry_size, entries_lba * sector_size)
+        for pos in range(0, len(table) - entry_size + 1, entry_size):
+            if any(table[pos:pos + 16]):
+                first_lba = struct.unpack_from('<Q', table, pos + 32)[0]
+                regions.append((first_lba * sector_size, SAMPLE_BOOT_REGION_SIZE))
+        break
+    
+    descriptor = os.pread(fd, 2048, 17 * 2048)
+    if descriptor[1:6] == b'CD001' and descriptor[7:30] == b'EL TORITO SPECIFICATION':
+        catalog_lba = struct.unpack_from('<I', descriptor, 0x47)[0]
+        regions.append((catalog_lba * 2048, 2048))
+        catalog = os.pread(fd, 2048, catalog_lba * 2048)
+        for pos in range(32, len(catalog) - 31, 32):
+            if catalog[pos] == 0x88:
+                load_rba = struct.unpack_from('<I', catalog, pos + 8)[0]
+                regions.append((load_rba * 2048, SAMPLE_BOOT_REGION_SIZE))
+    
+    clipped = [(start, min(length, image_size - start)) for start, length in regions if start < image_size]
+    return _merge_extents(clipped)
+
+
+def sample_windows(image_size: int, coverage: float, required: List[Tuple[int, int]] = (),
+                   window: int = SAMPLE_WINDOW_SIZE, seed: str = "") -> Tuple[List[Tuple[int, int]], int]:
+    """Pick verification windows covering about coverage of an image
+
+    The required ranges are always included and topped up with windows
+    drawn without replacement from a generator seeded by the image size
+    and seed, so the same image always gets the same sample. Returns the
+    merged ranges and how many random windows were drawn.
+    """
+    required = _merge_extents(list(required))
+    slots = (image_size + window - 1) // window
+    wanted = coverage * image_size - sum(length for _, length in required)
+    count = min(slots, max(0, -(-int(wanted) // window)))
+    rng = random.Random(f"{image_size}:{seed}")
+    windows = [(slot * window, min(window, image_size - slot * window)) for slot in rng.sample(range(slots), count)]
+    return _merge_extents(required + windows), count
+
+
+class _VerifyPipeline:
+    """Read a device back with I/O, comparison and hashing overlapped
+
+    One thread reads the device and, when a source is given, another reads
+    the same ranges of the source into buffers of its own. The calling
+    thread compares each pair of buffers and a worker thread hashes the
+    device data, so neither stream of reads waits on the CPU work. The
+    source is a descriptor read with pread, a stream (e.g. a
+    decompressing reader) that yields the extents' data in order, or a
+    _MappedSource, whose mapping is compared in place with no reader.
+
+    Every differing region is collected in ``mismatches`` as merged
+    (offset, length) extents at MISMATCH_GRANULARITY; once max_mismatches
+    extents are found the pipeline stops and sets ``truncated``.
+
+    With direct the device descriptor is O_DIRECT: reads are rounded up to
+    the alignment, and O_DIRECT is dropped if an extent starts unaligned.
+    """
+
+    def __init__(self, device_fd: int, extents: List[Tuple[int, int]],
+                 block_size: int = VERIFY_BLOCK_SIZE, source=None,
+                 hasher=None, depth: int = PIPELINE_DEPTH, stop_event: Optional[threading.Event] = None,
+                 on_progress: Optional[Callable[[int], None]] = None, direct: bool = False,
+                 max_mismatches: int = MISMATCH_MAX_EXTENTS):
+        self._extents = extents
+        self._direct = direct
+        self._block_size = block_size
+        self._hasher = hasher
+        self._stop_event = stop_event or threading.Event()
+        self._on_progress = on_progress
+        self._max_mismatches = max_mismatches
+        self._abort = threading.Event()
+        self._errors = []
+        # O_DIRECT needs page-aligned device buffers; otherwise bytearrays, which
+        # compare against a view with memcmp where two memoryviews compare per item
+        self._device_fd = device_fd
+        self._streams = [(self._read_device, _BufferRing(depth, block_size, aligned=direct),
+                          queue.Queue(maxsize=depth))]
+        if isinstance(source, _MappedSource) and direct:
+            source = source.fileno()
+        self._mapped = source if isinstance(source, _MappedSource) else None
+        if self._mapped is not None:
+            source = None
+        elif isinstance(source, int):
+            read_source = lambda view, offset: _pread_full(source, view, offset)
+        elif source is not None:
+            read_source = lambda view, offset: _read_full(source, view)
+        if source is not None:
+            self._streams.append((read_source, _BufferRing(depth, block_size), queue.Queue(maxsize=depth)))
+        self._hash_queue = queue.Queue(maxsize=depth)
+        self.mismatches = []
+        self.truncated = False
+        self.bytes_verified = 0
+
+    def _chunks(self):
+        for start, length in self._extents:
+            pos = start
+            end = start + length
+            while pos < end:
+                n = min(self._block_size, end - pos)
+                yield pos, n
+                pos += n
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._abort.is_set():
+            if self._stop_event.is_set():
+                self._abort.set()
+                break
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _reader(self, read: Callable[[memoryview, int], int], ring: _BufferRing, q: queue.Queue) -> None:
+        try:
+            for offset, want in self._chunks():
+                buf = None
+                while buf is None and not self._abort.is_set():
+                    try:
+                        buf = ring.acquire(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                if buf is None:
+                    return
+                with memoryview(buf) as view:
+                    n = read(view[:want], offset)
+                if not self._put(q, (offset, buf, n, want)) or n < want:
+                    return
+        except BaseException as e:
+            self._errors.append(e)
+            self._abort.set()
+        finally:
+            self._put(q, None)
+
+    def _read_device(self, view: memoryview, offset: int) -> int:
+        if not self._direct:
+            return _pread_full(self._device_fd, view, offset)
+        want = len(view)
+        size = _align_up(want, DIRECT_IO_ALIGNMENT)
+        if offset % DIRECT_IO_ALIGNMENT or size > self._block_size:
+            flags = fcntl.fcntl(self._device_fd, fcntl.F_GETFL)
+            fcntl.fcntl(self._device_fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+            self._direct = False
+            return _pread_full(self._device_fd, view, offset)
+        with memoryview(view.obj) as whole:
+            return min(_pread_full(self._device_fd, whole[:size], offset), want)
+
+    def _hash_worker(self) -> None:
+        ring = self._streams[0][1]
+        try:
+            while True:
+                item = self._get(self._hash_queue)
+                if item is None:
+                    break
+                buf, n = item
+                with memoryview(buf) as view:
+                    self._hasher.update(view[:n])
+                ring.release(buf)
+        except BaseException as e:
+            self._errors.append(e)
+            self._abort.set()
+
+    def _record(self, offset: int, extents: List[Tuple[int, int]]) -> None:
+        for start, length in extents:
+            start += offset
+            if self.mismatches and self.mismatches[-1][0] + self.mismatches[-1][1] == start:
+                last_start, last_length = self.mismatches[-1]
+                self.mismatches[-1] = (last_start, last_length + length)
+            else:
+                self.mismatches.append((start, length))
+        if len(self.mismatches) >= self._max_mismatches:
+            self.truncated = True
+
+    def _compare(self) -> bool:
+        """Compare until the device stream ends, returning whether it was read to the end"""
+        device_ring, device_queue = self._streams[0][1:]
+        while not self.truncated:
+            item = self._get(device_queue)
+            if item is None:
+                return not self._abort.is_set()
+            offset, buf, n, want = item
+            if n < want:
+                device_ring.release(buf)
+                raise FlashError(f"Unexpected end of device at byte {offset + n}")
+            
+            if self._mapped is not None:
+                source_view = self._mapped.view(offset, n)
+                source_n = len(source_view)
+                # A short last block has to be cut out of the device buffer
+                device_data = buf if n == len(buf) else bytes(memoryview(buf)[:n])
+                if source_n != n or device_data != source_view:
+                    with memoryview(buf) as view:
+                        self._record(offset, _diff_extents(source_view, view[:n], MISMATCH_GRANULARITY))
+                self._mapped.release(offset + n)
+                if source_n < n:
+                    device_ring.release(buf)
+                    return False
+            elif len(self._streams) > 1:
+                source_ring, source_queue = self._streams[1][1:]
+                source_item = self._get(source_queue)
+                if source_item is None:
+                    device_ring.release(buf)
+                    return False
+                _, source_buf, source_n, _ = source_item
+                with memoryview(buf) as view:
+                    # bytearray == memoryview compares with memcmp and no copy
+                    if n == len(source_buf):
+                        equal = source_n == n and source_buf == view
+                    else:
+                        equal = source_n == n and source_buf[:n] == view[:n]
+                    if not equal:
+                        with memoryview(source_buf) as source_view:
+                            self._record(offset, _diff_extents(source_view[:source_n], view[:n],
+                                                               MISMATCH_GRANULARITY))
+                source_ring.release(source_buf)
+                if source_n < n:
+                    # The source ended early; nothing further can be compared
+                    device_ring.release(buf)
+                    return False
+            
+            if self._hasher is None:
+                device_ring.release(buf)
+            elif not self._put(self._hash_queue, (buf, n)):
+                device_ring.release(buf)
+                return False
+            self.bytes_verified += n
+            if self._on_progress:
+                self._on_progress(self.bytes_verified)
+        return False
+
+    def run(self) -> List[Tuple[int, int]]:
+        """Verify every extent and return the mismatching regions found"""
+        threads = [
+            threading.Thread(target=self._reader, args=stream, name=f"verify-reader-{i}", daemon=True)
+            for i, stream in enumerate(self._streams)
+        ]
+        if self._hasher is not None:
+            threads.append(threading.Thread(target=self._hash_worker, name="verify-hash", daemon=True))
+        for t in threads:
+            t.start()
+        finished = False
+        try:
+            finished = self._compare()
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            # Stops the readers early when comparing ended before the data did
+            if not finished:
+                self._abort.set()
+            self._put(self._hash_queue, None)
+            for t in threads:
+                t.join()
+            for _, ring, _ in self._streams:
+                ring.close()
+        if self._stop_event.is_set():
+            raise FlashError("Verification cancelled")
+        if self._errors:
+            raise self._errors[0]
+        return self.mismatches
+
+
+def _unescape_mount_field(field: str) -> str:
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), field)
+
+
+def read_mountinfo(path: str = "/proc/self/mountinfo") -> List[Tuple[str, str, str]]:
+    """Parse a mountinfo file into (source, mountpoint, fstype) tuples"""
+    mounts = []
+    with open(path, 'r') as f:
+        for line in f:
+            fields, sep, tail = line.rstrip('\n').partition(' - ')
+            fields, tail = fields.split(), tail.split()
+            if not sep or len(fields) < 5 or len(tail) < 2:
+                continue
+            mounts.append((_unescape_mount_field(tail[1]), _unescape_mount_field(fields[4]), tail[0]))
+    return mounts
+
+
+def _umount_order(mounts: List[Tuple[str, str]]) -> List[str]:
+    """Mountpoints deepest first, so nested mounts come off before their parents"""
+    return sorted({mountpoint for _, mountpoint in mounts}, key=len, reverse=True)
+
+
+def _read_sysfs_attr(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _send_message(sock: socket.socket, message: Dict[str, Any], fd: Optional[int] = None) -> None:
+    """Send one length-prefixed JSON message, with fd attached via SCM_RIGHTS"""
+    payload = json.dumps(message).encode()
+    data = struct.pack('>I', len(payload)) + payload
+    ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, struct.pack('i', fd))] if fd is not None else []
+    sent = sock.sendmsg([data], ancillary)
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def _recv_message(sock: socket.socket) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+    """Receive one message and any descriptor sent with it; (None, None) at EOF"""
+    header = b''
+    fd = None
+    while len(header) < 4:
+        data, ancillary, _, _ = sock.recvmsg(4 - len(header), socket.CMSG_SPACE(struct.calcsize('i')))
+        for level, kind, cmsg in ancillary:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS and len(cmsg) >= struct.calcsize('i'):
+                fd = struct.unpack('i', cmsg[:struct.calcsize('i')])[0]
+        if not data:
+            if fd is not None:
+                os.close(fd)
+            return None, None
+        header += data
+    
+    length = struct.unpack('>I', header)[0]
+    payload = bytearray()
+    while len(payload) < length:
+        data = sock.recv(length - len(payload))
+        if not data:
+            if fd is not None:
+                os.close(fd)
+            return None, None
+        payload += data
+    return json.loads(payload.decode()), fd
+
+
+class PrivilegedHelper:
+    """Client for flash_helper.py, a root process that opens devices for us
+
+    The helper is started once through sudo (or pkexec) and connects back to
+    a Unix socket in a private 0700 directory. Device descriptors it opens
+    come back over SCM_RIGHTS, so all reads and writes then happen in this
+    process with no further fork/exec. It also unmounts and flushes devices.
+    The helper only touches whole-disk block devices that are removable or
+    on a USB bus and pass the same target checks as a flash, never the
+    system disk or an internal data disk.
+    """
+
+    def __init__(self, launcher: Optional[List[str]] = None, timeout: float = HELPER_START_TIMEOUT):
+        self.launcher = launcher
+        self.timeout = timeout
+        self._sock = None
+        self._process = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        """Whether a helper can be launched from this installation"""
+        return (sys.platform == 'linux' and not getattr(sys, 'frozen', False)
+                and os.path.exists(HELPER_SCRIPT) and hasattr(socket, 'SCM_RIGHTS'))
+
+    def start(self) -> None:
+        """Launch the helper and wait for it to connect"""
+        launcher = self.launcher
+        if launcher is None:
+            launcher = ["sudo"] if shutil.which("sudo") else ["pkexec"]
+        
+        directory = tempfile.mkdtemp(prefix="picoflasher-")
+        sock_path = os.path.join(directory, "helper.sock")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.chmod(directory, 0o700)
+            listener.bind(sock_path)
+            listener.listen(1)
+            listener.settimeout(0.5)
+            self._process = subprocess.Popen(launcher + [sys.executable, HELPER_SCRIPT, sock_path],
+                                             stdin=subprocess.DEVNULL)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    sock, _ = listener.accept()
+                    break
+                except socket.timeout:
+                    if self._process.poll() is not None:
+                        raise FlashError(f"Privileged helper exited with status {self._process.returncode}")
+                    if time.monotonic() > deadline:
+                        self._process.kill()
+                        raise FlashError("Privileged helper did not start in time")
+            
+            _, uid, _ = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                             struct.calcsize('3i')))
+            if uid != 0:
+                sock.close()
+                raise FlashError(f"Privileged helper connected as uid {uid}, not root")
+            sock.settimeout(None)
+            self._sock = sock
+        finally:
+            listener.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def close(self) -> None:
+        """Ask the helper to exit"""
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    _send_message(self._sock, {"op": "quit"})
+                except OSError:
+                    pass
+                self._sock.close()
+                self._sock = None
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+            self._process = None
+
+    def open(self, device_path: str, flags: int) -> int:
+        """Open a device with the helper's privileges and return our descriptor for it"""
+        _, fd = self._request({"op": "open", "path": device_path, "flags": flags})
+        if fd is None:
+            raise FlashError(f"Privileged helper sent no descriptor for {device_path}")
+        return fd
+
+    def flush(self, device_path: str) -> None:
+        """fsync a device and drop its buffers (BLKFLSBUF)"""
+        self._request({"op": "flush", "path": device_path})
+
+    def umount(self, device_path: str, force: bool = False) -> None:
+        """Unmount every mount of a device and its partitions"""
+        self._request({"op": "umount", "path": device_path, "force": force})
+
+    def _request(self, message: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[int]]:
+        with self._lock:
+            if self._sock is None:
+                raise FlashError("Privileged helper is not running")
+            _send_message(self._sock, message)
+            reply, fd = _recv_message(self._sock)
+        if reply is None:
+            raise FlashError("Privileged helper exited")
+        if not reply.get("ok"):
+            if fd is not None:
+                os.close(fd)
+            if reply.get("errno"):
+                raise OSError(reply["errno"], reply.get("error", ""))
+            raise FlashError(reply.get("error", "Privileged helper request failed"))
+        return reply, fd
+
+
 class SafeISOFlasher:
-    def __init__(self, verbose: bool = False, use_sudo: bool = True):
+    def __init__(self, verbose: bool = False, use_sudo: bool = True,
+                 checksum_cache: Optional[ChecksumCache] = None,
+                 flash_journal: Optional[FlashJournal] = None,
+                 sysfs_root: str = "/sys", mountinfo_path: str = "/proc/self/mountinfo"):
         self.verbose = verbose
         self.use_sudo = use_sudo
+        self.sysfs_root = sysfs_root
+        self.mountinfo_path = mountinfo_path
+        self._usb_ancestors = {}
+        self._helper = None
+        self._helper_failed = False
+        self.checksum_cache = checksum_cache if checksum_cache is not None else ChecksumCache()
+        self.flash_journal = flash_journal if flash_journal is not None else FlashJournal()
         self._progress_callback = None
         self._status_callback = None
+        self._device_progress_callback = None
+        self._session = None
         self._flash_process = None
         self._iso_size = 0
         self._progress_thread = None
@@ -130,6 +1960,51 @@ class SafeISOFlasher:
             self._log(f"Command not found: {' '.join(cmd)}", "ERROR")
             raise FlashError(f"Command not found: {cmd[0]}")
     
+    def _privileged_helper(self) -> Optional[PrivilegedHelper]:
+        """The running privileged helper, starting it on first use; None if unavailable"""
+        with self._lock:
+            if self._helper is not None or self._helper_failed or not self.use_sudo:
+                return self._helper
+            if os.geteuid() == 0:
+                # Already privileged, nothing to delegate
+                self._helper_failed = True
+                return None
+            if not PrivilegedHelper.available():
+                self._helper_failed = True
+                return None
+            helper = PrivilegedHelper()
+            try:
+                helper.start()
+            except (OSError, FlashError) as e:
+                self._log(f"Privileged helper unavailable, falling back to sudo commands: {e}", "WARNING")
+                self._helper_failed = True
+                return None
+            self._log("Started privileged helper")
+            self._helper = helper
+            return helper
+    
+    def close(self) -> None:
+        """Save the checksum cache and stop the privileged helper, if one was started"""
+        self.checksum_cache.flush()
+        with self._lock:
+            helper, self._helper = self._helper, None
+        if helper is not None:
+            helper.close()
+    
+    def _open_device(self, device_path: str, flags: int) -> int:
+        """os.open() a device, through the privileged helper if we lack permission"""
+        try:
+            return os.open(device_path, flags)
+        except PermissionError:
+            helper = self._privileged_helper()
+            if helper is None:
+                raise
+            return helper.open(device_path, flags)
+    
+    def _needs_dd(self, device_path: str, mode: int) -> bool:
+        """Whether the device is only reachable through sudo command-line tools"""
+        return self.use_sudo and not os.access(device_path, mode) and self._privileged_helper() is None
+    
     def list_usb_devices(self) -> List[USBDevice]:
         """Safely list all USB devices with comprehensive safety checks"""
         devices = []
@@ -147,67 +2022,161 @@ class SafeISOFlasher:
         except Exception as e:
             self._log(f"Error listing devices: {e}", "ERROR")
         
-        devices.sort(key=lambda x: x.device)
+        devices.sort(key=lambda x: x.device)
+        return devices
+    
+    def _list_usb_devices_linux(self) -> List[USBDevice]:
+        """List USB devices on Linux
+
+        Everything comes from sysfs and one read of mountinfo, so a scan
+        forks no processes however many disks are attached.
+        """
+        devices = []
+        try:
+            names = os.listdir(os.path.join(self.sysfs_root, "block"))
+        except OSError as e:
+            self._log(f"Failed to list block devices: {e}", "ERROR")
+            return devices
+        
+        mounts = self._mount_table()
+        system_disks = self._system_disk_names(mounts)
+        
+        for name in names:
+            device = self._describe_sysfs_disk(name, mounts, system_disks)
+            if device:
+                devices.append(device)
+        
         return devices
     
-    def _list_usb_devices_linux(self) -> List[USBDevice]:
-        """List USB devices on Linux"""
-        devices = []
-        all_devices = self._get_all_block_devices()
-        
-        for device_path in all_devices:
-            try:
-                
-                if self._is_system_disk(device_path):
-                    continue
-                    
-                
-                if not self._is_usb_device_linux(device_path):
-                    continue
+    def describe_usb_device(self, device_path: str) -> Optional[USBDevice]:
+        """Describe one block device, or return None if it is not a usable USB device"""
+        mounts = self._mount_table()
+        name = os.path.basename(device_path.rstrip('/'))
+        return self._describe_sysfs_disk(name, mounts, self._system_disk_names(mounts))
+    
+    def _describe_sysfs_disk(self, name: str, mounts: Dict[str, List[Tuple[str, str]]],
+                             system_disks: set) -> Optional[USBDevice]:
+        """Build a USBDevice for /sys/block/<name>, or None if it should not be offered"""
+        device_path = f"/dev/{name}"
+        try:
+            
+            if name in system_disks or self._is_rom_device(name):
+                return None
                 
+            
+            if not self._is_usb_device_linux(device_path):
+                return None
+            
+            
+            sysfs_path = os.path.join(self.sysfs_root, "block", name)
+            sectors = _read_sysfs_attr(os.path.join(sysfs_path, "size"))
+            # sysfs always counts 512-byte sectors, whatever the logical block size
+            size = int(sectors) * 512 if sectors else 0
+            if size == 0:
+                return None
                 
-                size = self._get_device_size(device_path)
-                if size == 0:
-                    continue
-                    
-                model, vendor, serial = self._get_device_info(device_path)
-                mountpoint = self._get_mountpoint(device_path)
-                filesystem = "Unknown"
-                used = 0
-                free = size
-                read_only = self._is_read_only(device_path)
-                
-                if mountpoint != "Not mounted":
-                    try:
-                        usage = psutil.disk_usage(mountpoint)
-                        used = usage.used
-                        free = usage.free
-                        
-                        for part in psutil.disk_partitions():
-                            if part.device == device_path:
-                                filesystem = part.fstype
-                                break
-                    except Exception as e:
-                        self._log(f"Error getting mount info for {device_path}: {e}", "DEBUG")
-                
-                devices.append(USBDevice(
-                    device=device_path,
-                    mountpoint=mountpoint,
-                    total_size=size,
-                    used=used,
-                    free=free,
-                    filesystem=filesystem,
-                    model=model,
-                    vendor=vendor,
-                    serial=serial,
-                    read_only=read_only
-                ))
-                
-            except (PermissionError, OSError, Exception) as e:
-                self._log(f"Error processing device {device_path}: {e}", "DEBUG")
+            model, vendor, serial = self._get_device_info(device_path)
+            read_only = _read_sysfs_attr(os.path.join(sysfs_path, "ro")) == '1'
+            mountpoint = "Not mounted"
+            filesystem = "Unknown"
+            used = 0
+            free = size
+            
+            # The disk itself, else the first of its partitions that is mounted
+            for candidate in self._device_nodes(device_path):
+                if candidate in mounts:
+                    mountpoint, filesystem = mounts[candidate][0]
+                    break
+            
+            if mountpoint != "Not mounted":
+                try:
+                    usage = psutil.disk_usage(mountpoint)
+                    used = usage.used
+                    free = usage.free
+                except Exception as e:
+                    self._log(f"Error getting mount info for {device_path}: {e}", "DEBUG")
+            
+            return USBDevice(
+                device=device_path,
+                mountpoint=mountpoint,
+                total_size=size,
+                used=used,
+                free=free,
+                filesystem=filesystem,
+                model=model,
+                vendor=vendor,
+                serial=serial,
+                read_only=read_only
+            )
+            
+        except (PermissionError, OSError, Exception) as e:
+            self._log(f"Error processing device {device_path}: {e}", "DEBUG")
+            return None
+    
+    def _device_nodes(self, device_path: str) -> List[str]:
+        """The disk's own node followed by its partitions' nodes"""
+        name = os.path.basename(device_path.rstrip('/'))
+        sysfs_path = os.path.join(self.sysfs_root, "block", name)
+        try:
+            entries = sorted(os.listdir(sysfs_path))
+        except OSError:
+            entries = []
+        return [f"/dev/{name}"] + [
+            f"/dev/{entry}" for entry in entries
+            if entry.startswith(name) and os.path.exists(os.path.join(sysfs_path, entry, "partition"))
+        ]
+    
+    def _is_rom_device(self, name: str) -> bool:
+        """Whether a block device is an optical drive, which cannot be flashed"""
+        # SCSI peripheral type 5 is TYPE_ROM (CD/DVD)
+        return name.startswith('sr') or \
+            _read_sysfs_attr(os.path.join(self.sysfs_root, "block", name, "device", "type")) == '5'
+    
+    def _mount_table(self) -> Dict[str, List[Tuple[str, str]]]:
+        """Map mount sources to their (mountpoint, fstype) pairs"""
+        table = {}
+        try:
+            for source, mountpoint, fstype in read_mountinfo(self.mountinfo_path):
+                table.setdefault(source, []).append((mountpoint, fstype))
+        except OSError as e:
+            self._log(f"Error reading {self.mountinfo_path}: {e}", "DEBUG")
+        return table
+    
+    def _system_disk_names(self, mounts: Optional[Dict[str, List[Tuple[str, str]]]] = None) -> set:
+        """Names of the disks under the root filesystem, through any dm/md layers"""
+        names = set()
+        pending = []
+        try:
+            root_dev = os.stat('/').st_dev
+            pending.append(f"{os.major(root_dev)}:{os.minor(root_dev)}")
+        except OSError:
+            pass
+        
+        # btrfs, overlayfs and friends report an anonymous st_dev; fall back to the mount source
+        for source, entries in (mounts if mounts is not None else self._mount_table()).items():
+            if source.startswith('/dev/') and any(mountpoint == '/' for mountpoint, _ in entries):
+                try:
+                    rdev = os.stat(source).st_rdev
+                    pending.append(f"{os.major(rdev)}:{os.minor(rdev)}")
+                except OSError:
+                    pass
+        
+        seen = set()
+        while pending:
+            entry = pending.pop()
+            path = entry if os.path.isabs(entry) else os.path.join(self.sysfs_root, "dev", "block", entry)
+            path = os.path.realpath(path)
+            if path in seen or not os.path.isdir(path):
                 continue
+            seen.add(path)
+            if os.path.exists(os.path.join(path, "partition")):
+                path = os.path.dirname(path)
+            names.add(os.path.basename(path))
+            slaves = os.path.join(path, "slaves")
+            if os.path.isdir(slaves):
+                pending.extend(os.path.join(slaves, slave) for slave in os.listdir(slaves))
         
-        return devices
+        return names
     
     def _list_usb_devices_darwin(self) -> List[USBDevice]:
         """List USB devices on macOS - placeholder implementation"""
@@ -219,30 +2188,13 @@ class SafeISOFlasher:
         self._log("Windows support not fully implemented", "WARNING")
         return []
     
-    def _get_all_block_devices(self) -> List[str]:
-        """Get all block devices using lsblk"""
-        devices = []
-        try:
-            result = self._run_command(["lsblk", "-ndo", "NAME,TYPE", "-J"])
-            data = json.loads(result.stdout)
-            for device in data.get('blockdevices', []):
-                if device.get('type') == 'disk':
-                    devices.append(f"/dev/{device['name']}")
-        except (json.JSONDecodeError, FlashError):
-            
-            try:
-                result = self._run_command(["lsblk", "-ndo", "NAME,TYPE"])
-                for line in result.stdout.splitlines():
-                    parts = line.strip().split()
-                    if len(parts) >= 2 and parts[1] == "disk":
-                        devices.append(f"/dev/{parts[0]}")
-            except FlashError:
-                self._log("Failed to list block devices", "ERROR")
-        
-        return devices
-    
     def _get_device_size(self, device_path: str) -> int:
         """Get the size of a block device in bytes"""
+        sectors = _read_sysfs_attr(os.path.join(self.sysfs_root, "block",
+                                                os.path.basename(device_path.rstrip('/')), "size"))
+        if sectors:
+            return int(sectors) * 512
+        
         try:
             
             result = self._run_command(["blockdev", "--getsize64", device_path])
@@ -264,7 +2216,7 @@ class SafeISOFlasher:
         
         try:
             device_name = os.path.basename(device_path.rstrip('/'))
-            sysfs_path = f"/sys/block/{device_name}"
+            sysfs_path = os.path.join(self.sysfs_root, "block", device_name)
             
             
             model_path = os.path.join(sysfs_path, "device", "model")
@@ -291,19 +2243,14 @@ class SafeISOFlasher:
     
     def _get_mountpoint(self, device_path: str) -> str:
         """Get the mountpoint of a device if mounted"""
-        try:
-            for partition in psutil.disk_partitions():
-                if partition.device == device_path:
-                    return partition.mountpoint
-            return "Not mounted"
-        except Exception:
-            return "Not mounted"
+        entries = self._mount_table().get(device_path)
+        return entries[0][0] if entries else "Not mounted"
     
     def _is_read_only(self, device_path: str) -> bool:
         """Check if device is read-only"""
         try:
             device_name = os.path.basename(device_path.rstrip('/'))
-            ro_path = f"/sys/block/{device_name}/ro"
+            ro_path = os.path.join(self.sysfs_root, "block", device_name, "ro")
             if os.path.exists(ro_path):
                 with open(ro_path, 'r') as f:
                     return f.read().strip() == '1'
@@ -315,80 +2262,84 @@ class SafeISOFlasher:
         """Check if a device is a USB device"""
         try:
             device_name = os.path.basename(device_path.rstrip('/'))
-            sysfs_path = f"/sys/block/{device_name}"
+            sysfs_path = os.path.join(self.sysfs_root, "block", device_name)
             
             if not os.path.exists(sysfs_path):
                 return False
             
             
-            removable_path = os.path.join(sysfs_path, "removable")
-            if os.path.exists(removable_path):
-                with open(removable_path, 'r') as f:
-                    if f.read().strip() == '1':
-                        return True
-            
-            
-            device_path_path = os.path.join(sysfs_path, "device", "path")
-            if os.path.exists(device_path_path):
-                with open(device_path_path, 'r') as f:
-                    if 'usb' in f.read().lower():
-                        return True
-            
-            
-            subsystem_path = os.path.join(sysfs_path, "device", "subsystem")
-            if os.path.exists(subsystem_path):
-                target = os.readlink(subsystem_path)
-                if 'usb' in target.lower():
-                    return True
+            if _read_sysfs_attr(os.path.join(sysfs_path, "removable")) == '1':
+                return True
             
             
-            if device_name.startswith('sd'):
-                try:
-                    
-                    parent_path = os.path.join(sysfs_path, "device")
-                    if os.path.exists(parent_path):
-                        for root, dirs, files in os.walk(parent_path):
-                            for file in files:
-                                if file == "modalias" and "usb" in file:
-                                    return True
-                            for dir_name in dirs:
-                                if "usb" in dir_name.lower():
-                                    return True
-                except Exception:
-                    pass
-                    
-            return False
+            return self._usb_ancestor(device_name) is not None
             
         except Exception as e:
             self._log(f"Error checking USB device: {e}", "DEBUG")
             return False
     
+    def _usb_ancestor(self, device_name: str) -> Optional[str]:
+        """Sysfs path of the USB device a disk hangs off, or None if it is not on a USB bus
+
+        The disk's real sysfs path is walked up towards the root looking for a
+        node in the usb subsystem. Results are memoised per (real sysfs path,
+        diskseq), which identify the physical disk even when a different one
+        later gets the same name and major:minor; forget_device() drops them.
+        """
+        sysfs_path = os.path.join(self.sysfs_root, "block", device_name)
+        real_path = os.path.realpath(sysfs_path)
+        key = (real_path, _read_sysfs_attr(os.path.join(sysfs_path, "diskseq")))
+        if key in self._usb_ancestors:
+            return self._usb_ancestors[key]
+        
+        ancestor = None
+        root = os.path.realpath(self.sysfs_root)
+        node = real_path
+        while node.startswith(root + os.sep):
+            subsystem = os.path.join(node, "subsystem")
+            if os.path.islink(subsystem) and os.path.basename(os.readlink(subsystem)) == "usb":
+                ancestor = node
+                break
+            node = os.path.dirname(node)
+        
+        if os.path.exists(real_path):
+            self._usb_ancestors[key] = ancestor
+        return ancestor
+    
+    def forget_device(self, device_path: str) -> None:
+        """Drop what is cached about a disk, e.g. once it has been unplugged"""
+        suffix = os.sep + os.path.basename(device_path.rstrip('/'))
+        with self._lock:
+            for key in [key for key in list(self._usb_ancestors) if key[0].endswith(suffix)]:
+                del self._usb_ancestors[key]
+    
     def _is_system_disk(self, device_path: str) -> bool:
         """Check if device is a system disk"""
         try:
-            
-            root_device = os.stat('/').st_dev
-            root_major = os.major(root_device)
-            
-            
-            device_name = os.path.basename(device_path.rstrip('/'))
-            with open(f"/sys/block/{device_name}/dev", 'r') as f:
-                dev_major, _ = map(int, f.read().strip().split(':'))
-                
-            
-            return dev_major == root_major
+            return os.path.basename(device_path.rstrip('/')) in self._system_disk_names()
         except Exception:
             return False
 
-    def validate_iso(self, iso_path: str) -> Dict[str, Any]:
-        """Validate ISO file with comprehensive checks"""
+    def validate_iso(self, iso_path: str, compute_checksum: bool = True) -> Dict[str, Any]:
+        """Validate ISO file with comprehensive checks
+
+        The checksum comes from the checksum cache when the file is unchanged.
+        compute_checksum=False skips the full-file SHA-256 pass on a cache
+        miss, for callers that hash the image while writing it.
+
+        Compressed images are recognised by their magic bytes. For those,
+        "size" is the uncompressed size from the container metadata, or 0 if
+        the format does not record it, and "checksum" covers the compressed file.
+        """
         result = {
             "valid": False,
             "size": 0,
             "error": "",
             "name": os.path.basename(iso_path),
             "checksum": "",
-            "is_hybrid": False
+            "is_hybrid": False,
+            "compression": "",
+            "compressed_size": 0
         }
         
         try:
@@ -415,20 +2366,28 @@ class SafeISOFlasher:
                 return result
             
             
-            if result["size"] > 10 * 1024 * 1024 * 1024:  
-                result["error"] = "ISO file is too large (>10GB)"
-                return result
-            
-            
             try:
                 with open(iso_path, 'rb') as f:
                     header = f.read(32768)
-                    if len(header) < 32768:
+                    result["compression"] = detect_compression(header)
+                    if result["compression"]:
+                        result["compressed_size"] = result["size"]
+                        result["size"] = image_uncompressed_size(iso_path, result["compression"]) or 0
+                    elif len(header) < 32768:
                         result["error"] = "ISO file is too small"
                         return result
                     
                     
-                    if b'CD001' in header:
+                    if result["size"] > 10 * 1024 * 1024 * 1024:  
+                        result["error"] = "ISO file is too large (>10GB)"
+                        return result
+                    
+                    
+                    if result["compression"]:
+                        result["valid"] = True
+                    
+                    
+                    elif b'CD001' in header:
                         result["valid"] = True
                     
                     
@@ -441,11 +2400,11 @@ class SafeISOFlasher:
                         result["valid"] = True
                     
                     
-                    f.seek(0)
-                    sha256_hash = hashlib.sha256()
-                    for chunk in iter(lambda: f.read(65536), b""):
-                        sha256_hash.update(chunk)
-                    result["checksum"] = sha256_hash.hexdigest()
+                    result["checksum"] = self.checksum_cache.get(iso_path) or ""
+                    if compute_checksum and not result["checksum"]:
+                        st = os.fstat(f.fileno())
+                        result["checksum"] = _sha256_file(iso_path)
+                        self.checksum_cache.put(iso_path, result["checksum"], st)
                     
             except IOError as e:
                 result["error"] = f"Cannot read ISO file: {e}"
@@ -483,59 +2442,446 @@ class SafeISOFlasher:
                 
         return False
     
-    def flash_iso(self, iso_path: str, usb_device: str, block_size: int = 4096, 
-                 verify: bool = True, sync_after: bool = True) -> Dict[str, Any]:
-        """Safely flash ISO to USB device with comprehensive error handling"""
+    def flash_iso(self, iso_path: str, usb_device: str, block_size: int = DEFAULT_BLOCK_SIZE, 
+                 verify: Union[bool, str] = True, sync_after: bool = True,
+                 direct_io: bool = False, auto_tune: bool = False,
+                 sparse: bool = False, unmapped: Optional[str] = None, delta: bool = False,
+                 resume: bool = False, sample_coverage: float = 0.02,
+                 repair_retries: int = 2) -> Dict[str, Any]:
+        """Safely flash ISO to USB device with comprehensive error handling"""
+        result = {
+            "success": False, 
+            "message": "", 
+            "checksum_verified": False,
+            "duration": 0,
+            "bytes_written": 0,
+            "block_size": block_size,
+            "checksum": "",
+            "bytes_skipped": 0,
+            "bytes_unchanged": 0,
+            "resumed_from": 0,
+            "verify_mode": "none",
+            "verify_coverage": 0.0,
+            "verify_confidence": 0.0,
+            "mismatches": [],
+            "bytes_repaired": 0,
+            "repair_attempts": 0,
+            "sync_duration": 0.0
+        }
+        
+        start_time = time.time()
+        self._stop_progress.clear()
+        self._cancelled = False
+        self._bytes_written = 0
+        self._usb_device = usb_device
+        
+        try:
+            self._set_status(FlashStatus.VALIDATING)
+            self._log("Validating ISO file...")
+            # The in-process write path hashes the image as it writes it
+            iso_validation = self.validate_iso(iso_path, compute_checksum=self._needs_dd(usb_device, os.W_OK))
+            if not iso_validation["valid"]:
+                result["message"] = f"Invalid ISO: {iso_validation['error']}"
+                self._set_status(FlashStatus.ERROR)
+                return result
+            
+            # A compressed file's checksum says nothing about the bytes on the device
+            expected_checksum = "" if iso_validation["compression"] else iso_validation["checksum"]
+            verify_mode = self._sampling_fallback(self._verify_mode(verify), iso_validation, usb_device)
+            
+            self._iso_size = iso_validation["size"]
+            sparse_plan = self._sparse_plan(iso_path, iso_validation) if sparse else None
+            if sparse_plan and not self._iso_size:
+                self._iso_size = sparse_plan["image_size"]
+            self._progress_update(5, 100)
+            
+            
+            target_error = self._prepare_target(usb_device, self._iso_size)
+            if target_error:
+                result["message"] = target_error
+                self._set_status(FlashStatus.ERROR)
+                return result
+            
+            self._progress_update(10, 100)
+            
+            
+            self._progress_thread = threading.Thread(target=self._monitor_progress)
+            self._progress_thread.daemon = True
+            self._progress_thread.start()
+            
+            
+            identity = self._flash_identity(iso_path, iso_validation, usb_device)
+            resume_from = self._resume_offset(usb_device, identity) if resume else 0
+            if not resume_from:
+                self.flash_journal.clear(usb_device)
+            
+            self._set_status(FlashStatus.FLASHING)
+            self._log(f"Flashing {iso_path} to {usb_device}...")
+            flash_result = self._safe_dd_write(iso_path, usb_device, block_size,
+                                               direct_io=direct_io, auto_tune=auto_tune,
+                                               compression=iso_validation["compression"],
+                                               sparse_plan=sparse_plan, unmapped=unmapped, delta=delta,
+                                               checkpoint=identity, resume_from=resume_from)
+            
+            self._stop_progress.set()
+            if self._progress_thread and self._progress_thread.is_alive():
+                self._progress_thread.join(timeout=5.0)
+            
+            if not flash_result["success"] or self._cancelled:
+                result["message"] = flash_result.get("message", "Flash process cancelled or failed")
+                self._set_status(FlashStatus.CANCELLED if self._cancelled else FlashStatus.ERROR)
+                return result
+            
+            self.flash_journal.clear(usb_device)
+            result["resumed_from"] = flash_result["resumed_from"]
+            result["bytes_written"] = flash_result["bytes_written"]
+            result["bytes_skipped"] = flash_result["bytes_skipped"]
+            result["bytes_unchanged"] = flash_result["bytes_unchanged"]
+            result["block_size"] = flash_result["block_size"]
+            result["checksum"] = flash_result["checksum"] or expected_checksum
+            if flash_result["extents"] is not None:
+                # The in-pass hash only covers the mapped ranges
+                result["checksum"] = expected_checksum
+                expected_checksum = ""
+            self._progress_update(95, 100)
+            
+            
+            if verify_mode != "none":
+                self._set_status(FlashStatus.VERIFYING)
+                self._log("Verifying flash...")
+                image_size = flash_result["bytes_written"] + flash_result["bytes_skipped"]
+                if verify_mode == "sample":
+                    sampled = self._verify_sampled(iso_path, usb_device, image_size, sample_coverage,
+                                                   extents=flash_result["extents"], direct_io=direct_io,
+                                                   seed=result["checksum"])
+                    verify_success = sampled["ok"]
+                    result["verify_coverage"] = sampled["coverage"]
+                    result["verify_confidence"] = sampled["confidence"]
+                    result["mismatches"] = sampled["mismatches"]
+                else:
+                    verify_success = self._verify_flash(iso_path, usb_device, expected_checksum,
+                                                        written_checksum=flash_result["checksum"],
+                                                        image_size=image_size,
+                                                        extents=flash_result["extents"], direct_io=direct_io,
+                                                        mismatches=result["mismatches"])
+                    result["verify_coverage"] = result["verify_confidence"] = 1.0
+                result["verify_mode"] = verify_mode
+                if not verify_success and repair_retries > 0 and result["mismatches"]:
+                    self._set_status(FlashStatus.REPAIRING)
+                    verify_success, result["bytes_repaired"], result["repair_attempts"] = self._repair_extents(
+                        iso_path, usb_device, result["mismatches"], repair_retries, direct_io
+                    )
+                result["checksum_verified"] = verify_success
+                if not verify_success:
+                    result["message"] = "Flash verification failed"
+                    self._set_status(FlashStatus.ERROR)
+                    return result
+            
+            
+            if sync_after:
+                self._set_status(FlashStatus.SYNCING)
+                result["sync_duration"] = self._flush_device(usb_device)
+            
+            self._progress_update(100, 100)
+            result["success"] = True
+            result["message"] = "Flash completed successfully!"
+            result["duration"] = time.time() - start_time
+            self._set_status(FlashStatus.COMPLETED)
+            
+        except Exception as e:
+            self._stop_progress.set()
+            result["message"] = f"Failed to flash ISO: {str(e)}"
+            result["duration"] = time.time() - start_time
+            self._set_status(FlashStatus.ERROR)
+            self._log(f"Exception during flash: {e}", "ERROR")
+            if self.verbose:
+                import traceback
+                self._log(f"Exception details: {traceback.format_exc()}", "DEBUG")
+            
+        return result
+    
+    def _http_session(self):
+        """Shared HTTP session so connections are pooled across requests"""
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+            return self._session
+    
+    def flash_iso_from_url(self, url: str, usb_device: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                           verify: bool = True, sync_after: bool = True, direct_io: bool = False,
+                           cache_path: Optional[str] = None, timeout: float = 30.0,
+                           connections: int = 1) -> Dict[str, Any]:
+        """Stream an ISO from a URL straight onto a USB device
+
+        HTTP response chunks go through the write pipeline and are hashed on
+        the fly, so downloading and writing overlap. With cache_path the
+        download is also teed to a local file, which is only kept if the
+        whole image arrived.
+
+        With connections > 1 and a cache_path the image is instead fetched
+        with parallel, resumable range requests into cache_path and then
+        flashed from there.
+        """
+        if connections > 1 and cache_path and requests is not None:
+            download = self.download_iso(url, cache_path, connections=connections, timeout=timeout)
+            if not download["success"]:
+                return {
+                    "success": False, "message": download["message"], "checksum_verified": False,
+                    "duration": download["duration"], "bytes_written": 0,
+                    "block_size": block_size, "checksum": ""
+                }
+            result = self.flash_iso(cache_path, usb_device, block_size=block_size, verify=verify,
+                                    sync_after=sync_after, direct_io=direct_io)
+            result["duration"] += download["duration"]
+            return result
+        
+        result = {
+            "success": False,
+            "message": "",
+            "checksum_verified": False,
+            "duration": 0,
+            "bytes_written": 0,
+            "block_size": block_size,
+            "checksum": "",
+            "sync_duration": 0.0
+        }
+        
+        if requests is None:
+            result["message"] = "The requests package is required to flash from a URL"
+            return result
+        
+        start_time = time.time()
+        self._stop_progress.clear()
+        self._cancelled = False
+        self._bytes_written = 0
+        self._usb_device = usb_device
+        part_path = f"{cache_path}.part" if cache_path else None
+        
+        try:
+            self._set_status(FlashStatus.VALIDATING)
+            self._log(f"Connecting to {url}...")
+            # Ask for identity encoding so the body is the image itself
+            response = self._http_session().get(
+                url, stream=True, timeout=timeout, headers={"Accept-Encoding": "identity"}
+            )
+            with response:
+                response.raise_for_status()
+                # A body cut short reads as EOF and is reported as incomplete below
+                response.raw.enforce_content_length = False
+                length = response.headers.get("Content-Length")
+                self._iso_size = int(length) if length and length.isdigit() else 0
+                self._progress_update(5, 100)
+                
+                target_error = self._prepare_target(usb_device, self._iso_size)
+                # Streaming needs the device open in-process, directly or through the helper
+                writable = os.access(usb_device, os.W_OK) or self.use_sudo
+                if not target_error and (not writable or self._needs_dd(usb_device, os.W_OK)):
+                    target_error = f"No write permission for device: {usb_device}"
+                if target_error:
+                    result["message"] = target_error
+                    self._set_status(FlashStatus.ERROR)
+                    return result
+                
+                self._progress_update(10, 100)
+                
+                
+                self._set_status(FlashStatus.FLASHING)
+                self._log(f"Streaming {url} to {usb_device}...")
+                sha256_hash = hashlib.sha256()
+                tee = open(part_path, 'wb') if part_path else None
+                dest_fd = self._open_for_write(usb_device, direct_io)
+                try:
+                    direct = direct_io and bool(fcntl.fcntl(dest_fd, fcntl.F_GETFL) & getattr(os, 'O_DIRECT', 0))
+                    if direct:
+                        block_size = _align_up(block_size, DIRECT_IO_ALIGNMENT)
+                    result["block_size"] = block_size
+                    bytes_written = self._pipelined_write(response.raw, dest_fd, block_size, self._iso_size,
+                                                          direct=direct, hasher=sha256_hash, tee=tee)
+                    if not self._stop_progress.is_set():
+                        os.fsync(dest_fd)
+                finally:
+                    os.close(dest_fd)
+                    if tee:
+                        tee.close()
+            
+            if self._cancelled or self._stop_progress.is_set():
+                result["message"] = "Write operation cancelled"
+                self._set_status(FlashStatus.CANCELLED if self._cancelled else FlashStatus.ERROR)
+                return result
+            
+            if self._iso_size and bytes_written != self._iso_size:
+                result["message"] = f"Download incomplete ({bytes_written} of {self._iso_size} bytes)"
+                self._set_status(FlashStatus.ERROR)
+                return result
+            
+            result["bytes_written"] = bytes_written
+            result["checksum"] = sha256_hash.hexdigest()
+            self._log(f"Write completed: {bytes_written} bytes written")
+            if part_path:
+                os.replace(part_path, cache_path)
+                part_path = None
+                self.checksum_cache.put(cache_path, result["checksum"])
+            self._progress_update(95, 100)
+            
+            
+            if verify:
+                self._set_status(FlashStatus.VERIFYING)
+                self._log("Verifying flash...")
+                verify_success = self._verify_flash(None, usb_device, "", written_checksum=result["checksum"],
+                                                    image_size=bytes_written, direct_io=direct_io)
+                result["checksum_verified"] = verify_success
+                if not verify_success:
+                    result["message"] = "Flash verification failed"
+                    self._set_status(FlashStatus.ERROR)
+                    return result
+            
+            
+            if sync_after:
+                self._set_status(FlashStatus.SYNCING)
+                result["sync_duration"] = self._flush_device(usb_device)
+            
+            self._progress_update(100, 100)
+            result["success"] = True
+            result["message"] = "Flash completed successfully!"
+            result["duration"] = time.time() - start_time
+            self._set_status(FlashStatus.COMPLETED)
+            
+        except Exception as e:
+            self._stop_progress.set()
+            result["message"] = f"Failed to flash ISO from URL: {str(e)}"
+            result["duration"] = time.time() - start_time
+            self._set_status(FlashStatus.ERROR)
+            self._log(f"Exception during flash: {e}", "ERROR")
+            if self.verbose:
+                import traceback
+                self._log(f"Exception details: {traceback.format_exc()}", "DEBUG")
+        finally:
+            if part_path and os.path.exists(part_path):
+                os.unlink(part_path)
+            
+        return result
+    
+    def download_iso(self, url: str, dest_path: str, connections: int = 4,
+                     timeout: float = 30.0) -> Dict[str, Any]:
+        """Download an ISO with parallel range requests, resuming an earlier attempt"""
+        result = {"success": False, "message": "", "path": dest_path, "size": 0,
+                  "duration": 0, "resumed": False}
+        if requests is None:
+            result["message"] = "The requests package is required to download an ISO"
+            return result
+        
+        start_time = time.time()
+        self._stop_progress.clear()
+        self._cancelled = False
+        self._set_status(FlashStatus.DOWNLOADING)
+        self._log(f"Downloading {url} with {connections} connection(s)...")
+        
+        session = self._http_session()
+        # Keep one pooled connection per worker
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(connections, 10))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        
+        last_reported = 0
+        
+        def on_progress(downloaded: int, total: int) -> None:
+            nonlocal last_reported
+            if total and downloaded - last_reported >= 10 * 1024 * 1024:
+                last_reported = downloaded
+                self._progress_update(min(downloaded / total * 100, 100), 100)
+        
+        downloader = RangedDownloader(session, connections=connections, timeout=timeout,
+                                      stop_event=self._stop_progress, on_progress=on_progress)
+        try:
+            result["size"] = downloader.download(url, dest_path)
+            result["resumed"] = downloader.resumed
+            if self._stop_progress.is_set():
+                result["message"] = "Download cancelled"
+                self._set_status(FlashStatus.CANCELLED if self._cancelled else FlashStatus.ERROR)
+            else:
+                result["success"] = True
+                result["message"] = "Download completed"
+                self._set_status(FlashStatus.IDLE)
+                self._log(f"Downloaded {result['size']} bytes to {dest_path}")
+        except Exception as e:
+            result["message"] = f"Download failed: {e}"
+            self._set_status(FlashStatus.ERROR)
+            self._log(result["message"], "ERROR")
+        
+        result["duration"] = time.time() - start_time
+        return result
+    
+    def set_device_progress_callback(self, callback: Callable[[str, int, int], None]) -> None:
+        """Set callback for per-device progress updates (device, bytes written, total bytes)"""
+        self._device_progress_callback = callback
+    
+    def _device_progress_update(self, device: str, value: int, max_value: int) -> None:
+        """Thread-safe per-device progress update"""
+        with self._lock:
+            if self._device_progress_callback:
+                self._device_progress_callback(device, value, max_value)
+    
+    def flash_iso_multi(self, iso_path: str, usb_devices: List[str], block_size: int = DEFAULT_BLOCK_SIZE,
+                        verify: Union[bool, str] = True, sync_after: bool = True,
+                        direct_io: bool = False, sample_coverage: float = 0.02) -> Dict[str, Any]:
+        """Flash one ISO to several USB devices at once
+
+        The image is read once into shared buffers and written to every device
+        in parallel, each with its own writer thread, progress, verification
+        and error. A failing device is dropped without aborting the others;
+        per-device outcomes are reported under result["devices"]. verify
+        takes the same modes as flash_iso.
+        """
         result = {
-            "success": False, 
-            "message": "", 
-            "checksum_verified": False,
+            "success": False,
+            "message": "",
             "duration": 0,
-            "bytes_written": 0
+            "checksum": "",
+            "devices": {
+                device: {"success": False, "message": "", "checksum_verified": False, "bytes_written": 0,
+                         "verify_coverage": 0.0, "verify_confidence": 0.0, "mismatches": [],
+                         "sync_duration": 0.0}
+                for device in usb_devices
+            }
         }
+        devices = result["devices"]
         
         start_time = time.time()
         self._stop_progress.clear()
         self._cancelled = False
         self._bytes_written = 0
-        self._usb_device = usb_device
+        self._usb_device = None
+        fds = {}
         
         try:
             self._set_status(FlashStatus.VALIDATING)
             self._log("Validating ISO file...")
-            iso_validation = self.validate_iso(iso_path)
+            iso_validation = self.validate_iso(iso_path, compute_checksum=False)
             if not iso_validation["valid"]:
                 result["message"] = f"Invalid ISO: {iso_validation['error']}"
                 self._set_status(FlashStatus.ERROR)
                 return result
             
             self._iso_size = iso_validation["size"]
+            expected_checksum = "" if iso_validation["compression"] else iso_validation["checksum"]
+            verify_mode = self._verify_mode(verify)
+            if usb_devices:
+                verify_mode = self._sampling_fallback(verify_mode, iso_validation, usb_devices[0])
             self._progress_update(5, 100)
             
+            for device in usb_devices:
+                target_error = self._prepare_target(device, self._iso_size)
+                if not target_error:
+                    try:
+                        fds[device] = self._open_for_write(device, direct_io)
+                    except OSError as e:
+                        target_error = f"Cannot open {device} for writing: {e}"
+                if target_error:
+                    devices[device]["message"] = target_error
+                    self._log(target_error, "WARNING")
             
-            self._log("Validating target device...")
-            if not self._validate_target_device(usb_device):
-                result["message"] = f"Invalid target device: {usb_device}"
-                self._set_status(FlashStatus.ERROR)
-                return result
-            
-            device_size = self._get_device_size(usb_device)
-            if device_size < self._iso_size:
-                result["message"] = f"Target device is too small ({device_size} bytes < {self._iso_size} bytes)"
-                self._set_status(FlashStatus.ERROR)
-                return result
-            
-            
-            if self._is_read_only(usb_device):
-                result["message"] = f"Target device is read-only: {usb_device}"
-                self._set_status(FlashStatus.ERROR)
-                return result
-            
-            
-            self._set_status(FlashStatus.UNMOUNTING)
-            self._log(f"Unmounting {usb_device}...")
-            if not self._safe_unmount(usb_device):
-                result["message"] = f"Failed to unmount device: {usb_device}"
+            if not fds:
+                result["message"] = "No usable target devices"
                 self._set_status(FlashStatus.ERROR)
                 return result
             
@@ -546,44 +2892,79 @@ class SafeISOFlasher:
             self._progress_thread.daemon = True
             self._progress_thread.start()
             
-            
             self._set_status(FlashStatus.FLASHING)
-            self._log(f"Flashing {iso_path} to {usb_device}...")
-            flash_result = self._safe_dd_write(iso_path, usb_device, block_size)
-            
-            self._stop_progress.set()
-            if self._progress_thread and self._progress_thread.is_alive():
-                self._progress_thread.join(timeout=5.0)
+            self._log(f"Flashing {iso_path} to {len(fds)} device(s)...")
+            try:
+                result["checksum"] = self._multi_write(iso_path, fds, block_size, devices,
+                                                       compression=iso_validation["compression"])
+            finally:
+                self._stop_progress.set()
+                if self._progress_thread and self._progress_thread.is_alive():
+                    self._progress_thread.join(timeout=5.0)
+                for fd in fds.values():
+                    os.close(fd)
             
-            if not flash_result["success"] or self._cancelled:
-                result["message"] = flash_result.get("message", "Flash process cancelled or failed")
-                self._set_status(FlashStatus.CANCELLED if self._cancelled else FlashStatus.ERROR)
+            if self._cancelled:
+                result["message"] = "Flash process cancelled"
+                self._set_status(FlashStatus.CANCELLED)
                 return result
             
-            result["bytes_written"] = flash_result["bytes_written"]
+            written = [device for device in fds if not devices[device]["message"]]
             self._progress_update(95, 100)
             
             
-            if verify:
+            if verify_mode != "none" and written:
                 self._set_status(FlashStatus.VERIFYING)
-                self._log("Verifying flash...")
-                verify_success = self._verify_flash(iso_path, usb_device, iso_validation["checksum"])
-                result["checksum_verified"] = verify_success
-                if not verify_success:
-                    result["message"] = "Flash verification failed"
-                    self._set_status(FlashStatus.ERROR)
-                    return result
+                self._log(f"Verifying {len(written)} device(s)...")
+                
+                def verify_device(device: str) -> None:
+                    if verify_mode == "sample":
+                        sampled = self._verify_sampled(iso_path, device, devices[device]["bytes_written"],
+                                                       sample_coverage, direct_io=direct_io,
+                                                       seed=result["checksum"])
+                        ok = sampled["ok"]
+                        devices[device]["verify_coverage"] = sampled["coverage"]
+                        devices[device]["verify_confidence"] = sampled["confidence"]
+                        devices[device]["mismatches"] = sampled["mismatches"]
+                    else:
+                        ok = self._verify_flash(iso_path, device, expected_checksum,
+                                                written_checksum=result["checksum"],
+                                                image_size=devices[device]["bytes_written"],
+                                                direct_io=direct_io, mismatches=devices[device]["mismatches"])
+                        devices[device]["verify_coverage"] = devices[device]["verify_confidence"] = 1.0
+                    devices[device]["checksum_verified"] = ok
+                    if not ok:
+                        devices[device]["message"] = "Flash verification failed"
+                
+                verifiers = [
+                    threading.Thread(target=verify_device, args=(device,), name=f"verify-{device}", daemon=True)
+                    for device in written
+                ]
+                for t in verifiers:
+                    t.start()
+                for t in verifiers:
+                    t.join()
             
             
-            if sync_after:
-                self._log("Synchronizing writes...")
-                self._safe_sync()
+            if sync_after and written:
+                # Each flush only touches its own device, so they can run side by side
+                self._set_status(FlashStatus.SYNCING)
+                with ThreadPoolExecutor(max_workers=len(written)) as pool:
+                    for device, duration in zip(written, pool.map(self._flush_device, written)):
+                        devices[device]["sync_duration"] = duration
             
+            for device in written:
+                if not devices[device]["message"]:
+                    devices[device]["success"] = True
+                    devices[device]["message"] = "Flash completed successfully!"
+            
+            succeeded = sum(1 for d in devices.values() if d["success"])
             self._progress_update(100, 100)
-            result["success"] = True
-            result["message"] = "Flash completed successfully!"
+            result["success"] = succeeded == len(usb_devices)
+            result["message"] = f"Flashed {succeeded} of {len(usb_devices)} device(s)"
             result["duration"] = time.time() - start_time
-            self._set_status(FlashStatus.COMPLETED)
+            self._set_status(FlashStatus.COMPLETED if succeeded else FlashStatus.ERROR)
+            self._log(result["message"])
             
         except Exception as e:
             self._stop_progress.set()
@@ -597,6 +2978,123 @@ class SafeISOFlasher:
             
         return result
     
+    def _multi_write(self, input_file: str, fds: Dict[str, int], block_size: int,
+                     devices: Dict[str, Dict[str, Any]], compression: str = "") -> str:
+        """Write one image to several open devices, returning its checksum
+
+        Per-device byte counts and errors are recorded in devices; each device
+        is fsynced after the last chunk is written.
+        """
+        input_stat = os.stat(input_file)
+        input_size = input_stat.st_size
+        if compression:
+            input_size = image_uncompressed_size(input_file, compression) or 0
+        direct_fds = {
+            device for device, fd in fds.items()
+            if fcntl.fcntl(fd, fcntl.F_GETFL) & getattr(os, 'O_DIRECT', 0)
+        }
+        if direct_fds:
+            block_size = _align_up(block_size, DIRECT_IO_ALIGNMENT)
+        order = list(fds)
+        last_reported = 0
+        
+        def report(device: str) -> None:
+            nonlocal last_reported
+            self._device_progress_update(device, devices[device]["bytes_written"], input_size)
+            live = [devices[d]["bytes_written"] for d in order if not devices[d]["message"]]
+            self._bytes_written = min(live) if live else 0
+            if input_size and self._bytes_written - last_reported >= 10 * 1024 * 1024:
+                last_reported = self._bytes_written
+                progress = 10 + (self._bytes_written / input_size) * 80
+                self._progress_update(min(progress, 90), 100)
+        
+        def fail(device: str, error: BaseException) -> None:
+            if getattr(error, 'errno', None) == 28:
+                devices[device]["message"] = "No space left on device"
+            else:
+                devices[device]["message"] = f"Write failed: {error}"
+            self._log(f"{device}: {devices[device]['message']}", "ERROR")
+        
+        def make_writer(device: str) -> Callable[[int, memoryview], None]:
+            fd = fds[device]
+            write = _direct_write if device in direct_fds else _write_all
+            
+            def write_chunk(offset: int, view: memoryview) -> None:
+                try:
+                    write(fd, view)
+                except Exception as e:
+                    # Marked at once so the stalled device stops holding back overall progress
+                    fail(device, e)
+                    raise
+                devices[device]["bytes_written"] += len(view)
+                report(device)
+            return write_chunk
+        
+        sha256_hash = hashlib.sha256()
+        if compression:
+            source = _DecompressingReader(input_file, compression)
+        else:
+            source = _MappedSource(input_file)
+        with source as src:
+            # O_DIRECT writes need aligned buffers of their own
+            mapped = isinstance(src, _MappedSource) and not direct_fds
+            pipeline = _WritePipeline(
+                src.readinto,
+                [make_writer(device) for device in order],
+                block_size,
+                stop_event=self._stop_progress,
+                aligned=bool(direct_fds),
+                observers=(lambda offset, view: sha256_hash.update(view),),
+                isolate_errors=True,
+                read_view=src.read_view if mapped else None,
+                release_view=src.release if mapped else None
+            )
+            try:
+                pipeline.run()
+            except Exception:
+                # Every writer failing is reported per device below
+                if len(pipeline.writer_errors) < len(order):
+                    raise
+            finally:
+                for index, error in pipeline.writer_errors.items():
+                    if not devices[order[index]]["message"]:
+                        fail(order[index], error)
+        
+        for device in order:
+            if devices[device]["message"]:
+                continue
+            try:
+                os.fsync(fds[device])
+            except OSError as e:
+                devices[device]["message"] = f"Write failed: {e}"
+                self._log(f"{device}: {devices[device]['message']}", "ERROR")
+        
+        if len(pipeline.writer_errors) == len(order) or self._stop_progress.is_set():
+            return ""
+        checksum = sha256_hash.hexdigest()
+        if not compression:
+            self.checksum_cache.put(input_file, checksum, input_stat)
+        return checksum
+    
+    def _prepare_target(self, usb_device: str, image_size: int) -> str:
+        """Validate and unmount a target device, returning an error message on failure"""
+        self._log(f"Validating target device {usb_device}...")
+        if not self._validate_target_device(usb_device):
+            return f"Invalid target device: {usb_device}"
+        
+        device_size = self._get_device_size(usb_device)
+        if device_size < image_size:
+            return f"Target device is too small ({device_size} bytes < {image_size} bytes)"
+        
+        if self._is_read_only(usb_device):
+            return f"Target device is read-only: {usb_device}"
+        
+        self._set_status(FlashStatus.UNMOUNTING)
+        self._log(f"Unmounting {usb_device}...")
+        if not self._safe_unmount(usb_device):
+            return f"Failed to unmount device: {usb_device}"
+        return ""
+    
     def _validate_target_device(self, device_path: str) -> bool:
         """Validate that the target device is safe to write to"""
         try:
@@ -605,13 +3103,16 @@ class SafeISOFlasher:
                 return False
             
             
-            if not os.path.exists(f"/sys/block/{os.path.basename(device_path)}"):
+            if not os.path.exists(os.path.join(self.sysfs_root, "block", os.path.basename(device_path))):
                 return False
             
             
             if self._is_system_disk(device_path):
                 return False
             
+            if self._is_rom_device(os.path.basename(device_path)):
+                return False
+            
             
             
             device_name = os.path.basename(device_path)
@@ -630,65 +3131,123 @@ class SafeISOFlasher:
         except Exception:
             return False
     
-    def _safe_unmount(self, device_path: str) -> bool:
-        """Safely unmount a device and all its partitions"""
+    def _safe_unmount(self, device_path: str, timeout: float = UNMOUNT_TIMEOUT) -> bool:
+        """Safely unmount a device and all its partitions
+
+        Every mountpoint goes to a single umount call; completion is awaited
+        by polling mountinfo, which the kernel flags on every mount table
+        change, so this returns as soon as the last one is gone. If umount
+        refuses, a forced umount follows straight away.
+        """
         try:
             device_name = os.path.basename(device_path.rstrip('/'))
-            unmounted_any = False
-
+            mounted = self._device_mountpoints(device_path)
             
-            for partition in psutil.disk_partitions(all=True):
-                if partition.device.startswith(device_path):
-                    self._log(f"Unmounting {partition.device} (mounted at {partition.mountpoint})")
-                    try:
-                        self._run_command(["umount", partition.device], check=False)
-                        unmounted_any = True
-                    except FlashError:
-                        
-                        try:
-                            self._run_command(["umount", "-f", partition.device], check=False)
-                            unmounted_any = True
-                        except FlashError:
-                            self._log(f"Failed to unmount {partition.device}", "WARNING")
-
+            if not mounted:
+                self._log(f"No partitions were mounted for {device_name}")
+                return True
             
-            time.sleep(2)
-
             
-            still_mounted = [
-                p for p in psutil.disk_partitions(all=True)
-                if p.device.startswith(device_path)
-            ]
+            for source, mountpoint in mounted:
+                self._log(f"Unmounting {source} (mounted at {mountpoint})")
+            
+            helper = self._privileged_helper()
+            for force in (False, True):
+                try:
+                    if helper is not None:
+                        helper.umount(device_path, force)
+                    else:
+                        completed = self._run_command(["umount"] + (["-f"] if force else []) +
+                                                      _umount_order(mounted), check=False)
+                        if completed.returncode != 0:
+                            raise FlashError(completed.stderr.strip() or f"umount exited with {completed.returncode}")
+                    mounted = self._wait_for_unmount(device_path, timeout)
+                except (OSError, FlashError) as e:
+                    # A refused umount will not finish later; retry the rest forcibly right away
+                    self._log(f"Failed to unmount {device_name}: {e}", "WARNING")
+                    mounted = self._device_mountpoints(device_path)
+                if not mounted:
+                    break
+            
             
-            if still_mounted:
-                for p in still_mounted:
-                    self._log(f"Warning: {p.device} is still mounted at {p.mountpoint}", "WARNING")
+            if mounted:
+                for source, mountpoint in mounted:
+                    self._log(f"Warning: {source} is still mounted at {mountpoint}", "WARNING")
                 return False
 
-            if unmounted_any:
-                self._log(f"Successfully unmounted all partitions of {device_name}")
-            else:
-                self._log(f"No partitions were mounted for {device_name}")
-                
+            self._log(f"Successfully unmounted all partitions of {device_name}")
             return True
 
         except Exception as e:
             self._log(f"Error while unmounting {device_path}: {e}", "ERROR")
             return False
+    
+    def _device_mountpoints(self, device_path: str) -> List[Tuple[str, str]]:
+        """(source, mountpoint) for every mount of the device or its partitions"""
+        table = self._mount_table()
+        return [(node, mountpoint) for node in self._device_nodes(device_path)
+                for mountpoint, _ in table.get(node, [])]
+    
+    def _wait_for_unmount(self, device_path: str, timeout: float) -> List[Tuple[str, str]]:
+        """Wait until the device has no mounts left; return whatever is still mounted"""
+        deadline = time.monotonic() + timeout
+        try:
+            # The mountinfo fd reports POLLPRI whenever the mount table changes after it was opened
+            watch = open(self.mountinfo_path, 'rb')
+        except OSError:
+            watch = None
+        try:
+            poller = None
+            if watch is not None and hasattr(select, 'poll'):
+                poller = select.poll()
+                poller.register(watch, select.POLLPRI | select.POLLERR)
+            while True:
+                mounted = self._device_mountpoints(device_path)
+                remaining = deadline - time.monotonic()
+                if not mounted or remaining <= 0:
+                    return mounted
+                if poller is not None:
+                    poller.poll(remaining * 1000)
+                else:
+                    time.sleep(min(0.1, remaining))
+        finally:
+            if watch is not None:
+                watch.close()
 
-    def _safe_dd_write(self, input_file: str, output_device: str, block_size: int) -> Dict[str, Any]:
-        """Custom safe implementation of dd with progress tracking"""
-        result = {"success": False, "message": "", "bytes_written": 0}
+    def _safe_dd_write(self, input_file: str, output_device: str, block_size: int,
+                       direct_io: bool = False, auto_tune: bool = False,
+                       compression: str = "", sparse_plan: Optional[Dict[str, Any]] = None,
+                       unmapped: Optional[str] = None, delta: bool = False,
+                       checkpoint: Optional[Dict[str, Any]] = None, resume_from: int = 0) -> Dict[str, Any]:
+        """Custom safe implementation of dd with progress tracking
+
+        A compressed input is decompressed on the fly by the pipeline's reader;
+        the reported checksum then covers the decompressed image. With a
+        sparse_plan only its extents are written and hashed, and "extents"
+        in the result lists them for verification. With delta the device is
+        read alongside the image and only differing blocks are written;
+        "bytes_unchanged" counts the rest. A checkpoint identity turns on
+        progress records in the flash journal, and resume_from skips data an
+        earlier run already committed.
+        """
+        result = {"success": False, "message": "", "bytes_written": 0, "block_size": block_size,
+                  "checksum": "", "bytes_skipped": 0, "bytes_unchanged": 0, "extents": None,
+                  "resumed_from": 0}
         
         try:
-            self._log(f"Starting safe write operation (block size: {block_size})")
-            
-            input_size = os.path.getsize(input_file)
+            input_stat = os.stat(input_file)
+            input_size = input_stat.st_size
             bytes_written = 0
+            if compression:
+                input_size = image_uncompressed_size(input_file, compression) or 0
+                if auto_tune:
+                    self._log("Block size auto-tuning needs a raw image, skipping", "WARNING")
+                    auto_tune = False
             
             
+            use_dd = self._needs_dd(output_device, os.W_OK)
             if not os.access(output_device, os.W_OK):
-                if self.use_sudo:
+                if use_dd:
                     
                     try:
                         test_cmd = ["sudo", "test", "-w", output_device]
@@ -696,13 +3255,63 @@ class SafeISOFlasher:
                     except subprocess.CalledProcessError:
                         result["message"] = f"No write permission for device: {output_device}"
                         return result
-                else:
+                elif not self.use_sudo:
                     result["message"] = f"No write permission for device: {output_device}"
                     return result
             
-            with open(input_file, 'rb') as src:
+            if sparse_plan and use_dd:
+                self._log("Sparse writes are not available through sudo dd, writing the full image", "WARNING")
+                sparse_plan = None
+            if sparse_plan and unmapped is None:
+                # A hole in a raw image reads as zeros; what a bmap leaves out is don't-care
+                unmapped = "zeroout" if sparse_plan["source"] == "holes" else "skip"
+            if delta and use_dd:
+                self._log("Delta writes are not available through sudo dd, writing the full image", "WARNING")
+                delta = False
+            if resume_from and (use_dd or delta):
+                if use_dd:
+                    self._log("Resuming is not available through sudo dd, starting from the beginning", "WARNING")
+                else:
+                    self._log("Resuming is not available for delta writes, comparing from the beginning "
+                              "(blocks already written are skipped)", "WARNING")
+                resume_from = 0
+            if checkpoint and use_dd:
+                checkpoint = None
+            if delta and auto_tune:
+                self._log("Block size auto-tuning rewrites the start of the device, skipping for delta writes",
+                          "WARNING")
+                auto_tune = False
+            
+            if compression:
+                self._log(f"Decompressing {compression} image while writing")
+                source = _DecompressingReader(input_file, compression)
+            else:
+                source = _MappedSource(input_file)
+            with source as src:
                 
-                if self.use_sudo:
+                if use_dd and compression:
+                    
+                    result["block_size"] = block_size
+                    self._log(f"Starting safe write operation (block size: {block_size})")
+                    bytes_written, result["checksum"] = self._pipe_to_dd(src, output_device, block_size, input_size)
+                    if self._stop_progress.is_set():
+                        result["message"] = "Write operation cancelled"
+                        return result
+                    
+                    result["bytes_written"] = bytes_written
+                    result["success"] = True
+                elif use_dd:
+                    
+                    if auto_tune:
+                        block_size = self._auto_tune_block_size(
+                            input_size, lambda size, count: self._run_command(
+                                ["dd", f"if={input_file}", f"of={output_device}", f"bs={size}",
+                                 f"count={count}", "conv=notrunc,fsync", "status=none"]
+                            ),
+                            default=block_size
+                        )
+                    result["block_size"] = block_size
+                    self._log(f"Starting safe write operation (block size: {block_size})")
                     
                     dd_process = subprocess.Popen(
                         ["sudo", "dd", f"if={input_file}", f"of={output_device}", 
@@ -742,27 +3351,94 @@ class SafeISOFlasher:
                     result["success"] = True
                 else:
                     
-                    with open(output_device, 'wb') as dest:
-                        while not self._stop_progress.is_set():
-                            chunk = src.read(block_size)
-                            if not chunk:
-                                break
-                            
-                            try:
-                                dest.write(chunk)
-                                bytes_written += len(chunk)
-                                self._bytes_written = bytes_written
-                                
-                                
-                                if bytes_written % (10 * 1024 * 1024) == 0:  
-                                    progress = 10 + (bytes_written / input_size) * 80
-                                    self._progress_update(min(progress, 90), 100)
-                                    
-                            except IOError as e:
-                                if e.errno == 28:  
-                                    result["message"] = "No space left on device"
-                                    return result
-                                raise
+                    dest_fd = self._open_for_write(output_device, direct_io)
+                    direct = direct_io and bool(fcntl.fcntl(dest_fd, fcntl.F_GETFL) & getattr(os, 'O_DIRECT', 0))
+                    try:
+                        if auto_tune:
+                            block_size = self._auto_tune_block_size(
+                                input_size, lambda size, count: self._probe_write(src, dest_fd, size, count, direct),
+                                default=block_size
+                            )
+                        if direct:
+                            block_size = _align_up(block_size, DIRECT_IO_ALIGNMENT)
+                            self._log("Using direct I/O")
+                        result["block_size"] = block_size
+                        self._log(f"Starting safe write operation (block size: {block_size})")
+                        
+                        delta_writer = None
+                        if delta:
+                            write = _direct_write if direct else _write_all
+                            delta_writer = _DeltaWriter(
+                                self._open_device(output_device, os.O_RDONLY),
+                                lambda offset, view: write(dest_fd, view, offset),
+                                on_report=lambda changed, unchanged: self._log(
+                                    f"Delta: {changed // (1024 * 1024)} MiB rewritten, "
+                                    f"{unchanged // (1024 * 1024)} MiB unchanged"
+                                )
+                            )
+                            self._log("Writing only blocks that differ from the device")
+                        
+                        resumable = None
+                        record_checkpoint = None
+                        if checkpoint:
+                            record_checkpoint = lambda offset: self.flash_journal.record(output_device, checkpoint,
+                                                                                         offset)
+                            resumable = _ResumableWriter(
+                                dest_fd,
+                                self._open_device(output_device, os.O_RDONLY) if resume_from else None,
+                                resume_from=resume_from,
+                                on_commit=record_checkpoint
+                            )
+                            if resume_from:
+                                self._log(f"Resuming from byte {resume_from}, re-checking the last "
+                                          f"{RESUME_VERIFY_WINDOW // (1024 * 1024)} MiB first")
+                                result["resumed_from"] = resume_from
+                        
+                        sha256_hash = hashlib.sha256()
+                        # With the checksum already known and nothing to transform, the
+                        # data never needs to pass through this process
+                        known_checksum = None
+                        if not (compression or sparse_plan or delta_writer or resume_from or direct or auto_tune):
+                            known_checksum = self.checksum_cache.get(input_file)
+                        try:
+                            zero_copied = None
+                            if known_checksum:
+                                zero_copied = self._zero_copy_write(src.fileno(), dest_fd, input_size,
+                                                                    on_commit=record_checkpoint)
+                            if zero_copied is not None:
+                                bytes_written = zero_copied
+                            elif sparse_plan:
+                                extents = sparse_plan["extents"]
+                                mapped = sum(length for _, length in extents)
+                                reader = _ExtentReader(src, extents, sparse_plan["checksums"],
+                                                       sparse_plan["checksum_type"])
+                                bytes_written = self._pipelined_write(reader, dest_fd, block_size, mapped,
+                                                                      direct=direct, hasher=sha256_hash,
+                                                                      locate=lambda: reader.offset,
+                                                                      delta=delta_writer, resumable=resumable)
+                                result["extents"] = extents
+                                result["bytes_skipped"] = sparse_plan["image_size"] - mapped
+                                if unmapped not in (None, "skip") and not self._stop_progress.is_set():
+                                    self._clear_unmapped(dest_fd, extents, sparse_plan["image_size"], unmapped)
+                            else:
+                                bytes_written = self._pipelined_write(src, dest_fd, block_size, input_size,
+                                                                      direct=direct, hasher=sha256_hash,
+                                                                      delta=delta_writer, resumable=resumable)
+                        except OSError as e:
+                            if e.errno == 28:  
+                                result["message"] = "No space left on device"
+                                return result
+                            raise
+                        finally:
+                            if delta_writer:
+                                delta_writer.close()
+                                os.close(delta_writer.read_fd)
+                                result["bytes_unchanged"] = delta_writer.bytes_unchanged
+                            if resumable and resumable.resume_from:
+                                os.close(resumable.read_fd)
+                                if resumable.window_mismatch:
+                                    self._log("Data before the checkpoint did not match the image and was "
+                                              "rewritten", "WARNING")
                         
                         
                         if self._stop_progress.is_set():
@@ -770,13 +3446,22 @@ class SafeISOFlasher:
                             return result
                         
                         
-                        dest.flush()
-                        os.fsync(dest.fileno())
-                        
-                        result["bytes_written"] = bytes_written
-                        result["success"] = True
+                        os.fsync(dest_fd)
+                    finally:
+                        os.close(dest_fd)
+                    
+                    result["bytes_written"] = bytes_written
+                    result["checksum"] = known_checksum if zero_copied is not None else sha256_hash.hexdigest()
+                    if not compression and not sparse_plan:
+                        self.checksum_cache.put(input_file, result["checksum"], input_stat)
+                    result["success"] = True
                 
                 self._log(f"Write completed: {result['bytes_written']} bytes written")
+                if result["bytes_skipped"]:
+                    self._log(f"Skipped {result['bytes_skipped']} bytes of unmapped image data")
+                if delta:
+                    self._log(f"Delta: {result['bytes_written'] - result['bytes_unchanged']} bytes rewritten, "
+                              f"{result['bytes_unchanged']} bytes already on the device")
                 
         except PermissionError:
             result["message"] = "Permission denied for writing to device"
@@ -787,6 +3472,357 @@ class SafeISOFlasher:
             
         return result
     
+    def _flash_identity(self, iso_path: str, iso_validation: Dict[str, Any], usb_device: str) -> Dict[str, Any]:
+        """What a flash journal checkpoint must match before it can be resumed"""
+        model, vendor, serial = self._get_device_info(usb_device)
+        return {
+            "image": os.path.abspath(iso_path),
+            "image_key": ChecksumCache._key(os.stat(iso_path)),
+            "checksum": iso_validation["checksum"] or self.checksum_cache.get(iso_path) or "",
+            "device_model": model,
+            "device_vendor": vendor,
+            "device_serial": serial,
+            "device_size": self._get_device_size(usb_device),
+        }
+    
+    def _resume_offset(self, usb_device: str, identity: Dict[str, Any]) -> int:
+        """Offset to resume a flash from, or 0 when there is no usable checkpoint
+
+        Every flash checkpoints its progress in the flash journal; a checkpoint
+        is only used for the same image on the same device.
+        """
+        entry = self.flash_journal.get(usb_device)
+        if not entry:
+            self._log(f"No checkpoint for {usb_device}, starting from the beginning")
+            return 0
+        
+        for key, value in identity.items():
+            if key == "checksum" and not (value and entry.get(key)):
+                continue
+            if entry.get(key) != value:
+                self._log(f"Checkpoint for {usb_device} is for a different image or device "
+                          f"({key} changed), starting from the beginning", "WARNING")
+                return 0
+        return int(entry.get("offset", 0))
+    
+    def _sparse_plan(self, iso_path: str, iso_validation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Work out which ranges of an image hold data, or None to write it all
+
+        The ranges come from a .bmap file next to the image, or else from the
+        non-hole extents of a raw image file. What happens to the rest of the
+        image area on the device is the flash's unmapped option: "skip",
+        "zeroout" or "discard". By default holes are zeroed, since they read
+        as zeros, and regions a bmap leaves out are skipped.
+        """
+        bmap_path = find_bmap(iso_path)
+        if bmap_path:
+            bmap = parse_bmap(bmap_path)
+            if iso_validation["size"] and bmap.image_size != iso_validation["size"]:
+                raise FlashError(f"bmap image size {bmap.image_size} does not match the image "
+                                 f"({iso_validation['size']} bytes)")
+            self._log(f"Using block map {bmap_path}")
+            return {
+                "source": "bmap",
+                "image_size": bmap.image_size,
+                "extents": [(start, length) for start, length, _ in bmap.ranges],
+                "checksums": [checksum for _, _, checksum in bmap.ranges],
+                "checksum_type": bmap.checksum_type,
+            }
+        
+        if iso_validation["compression"]:
+            self._log("No bmap file for compressed image, writing the full image", "WARNING")
+            return None
+        
+        with open(iso_path, 'rb') as f:
+            extents = _file_data_extents(f.fileno(), iso_validation["size"])
+        self._log(f"Found {len(extents)} data extent(s) in {iso_path}")
+        return {
+            "source": "holes",
+            "image_size": iso_validation["size"],
+            "extents": extents,
+            "checksums": None,
+            "checksum_type": "sha256",
+        }
+    
+    def _clear_unmapped(self, fd: int, extents: List[Tuple[int, int]], image_size: int, action: str) -> None:
+        """Zero or discard the device ranges a sparse write skipped
+
+        Discard is only a hint, so a device that refuses it is left as is. A
+        device that refuses BLKZEROOUT gets the zeros written out instead.
+        """
+        request = {"zeroout": BLKZEROOUT, "discard": BLKDISCARD}.get(action)
+        if request is None:
+            raise FlashError(f"Unknown unmapped region action: {action}")
+        
+        gaps = []
+        pos = 0
+        for start, length in extents:
+            if start > pos:
+                gaps.append((pos, start - pos))
+            pos = max(pos, start + length)
+        if pos < image_size:
+            gaps.append((pos, image_size - pos))
+        
+        for index, (start, length) in enumerate(gaps):
+            try:
+                fcntl.ioctl(fd, request, struct.pack('QQ', start, length))
+            except OSError as e:
+                self._log(f"Cannot {action} bytes {start}-{start + length - 1}: {e}", "WARNING")
+                if action != "zeroout":
+                    return
+                self._log("Writing zeros to the unmapped regions instead")
+                for gap_start, gap_length in gaps[index:]:
+                    _write_zeros(fd, gap_start, gap_length)
+                break
+        self._log(f"Applied {action} to {len(gaps)} unmapped region(s)")
+    
+    def _pipe_to_dd(self, src, output_device: str, block_size: int, input_size: int) -> Tuple[int, str]:
+        """Feed src through the write pipeline into a privileged dd, returning (bytes, checksum)"""
+        dd_process = subprocess.Popen(
+            ["sudo", "dd", f"of={output_device}", f"bs={block_size}", "iflag=fullblock",
+             "conv=fsync", "status=none"],
+            stdin=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        sha256_hash = hashlib.sha256()
+        try:
+            bytes_written = self._pipelined_write(src, dd_process.stdin.fileno(), block_size, input_size,
+                                                  hasher=sha256_hash)
+        except BaseException:
+            dd_process.kill()
+            raise
+        finally:
+            dd_process.stdin.close()
+        
+        if self._stop_progress.is_set():
+            dd_process.terminate()
+        _, stderr = dd_process.communicate()
+        if dd_process.returncode != 0 and not self._stop_progress.is_set():
+            raise FlashError(f"dd command failed: {stderr.decode()}")
+        return bytes_written, sha256_hash.hexdigest()
+    
+    def _auto_tune_block_size(self, input_size: int, write_probe: Callable[[int, int], None],
+                              default: int) -> int:
+        """Pick the fastest block size by timing a short write of the image head
+
+        write_probe(size, count) must write count blocks of size bytes from the
+        start of the image to the start of the device and flush them. The
+        probe rewrites data the flash itself writes next, so it is harmless.
+        Candidates are tried smallest first until one is no faster than the
+        best so far, which keeps the probe short on slow sticks.
+        """
+        probe_bytes = min(AUTO_TUNE_PROBE_BYTES, input_size // DIRECT_IO_ALIGNMENT * DIRECT_IO_ALIGNMENT)
+        candidates = [size for size in AUTO_TUNE_CANDIDATES if size <= probe_bytes]
+        if not candidates:
+            self._log(f"Image too small to auto-tune, using block size {default}", "DEBUG")
+            return default
+        
+        self._log("Auto-tuning block size...")
+        best_size, best_rate = default, 0.0
+        for size in candidates:
+            if self._stop_progress.is_set():
+                break
+            count = probe_bytes // size
+            try:
+                start = time.monotonic()
+                write_probe(size, count)
+                elapsed = max(time.monotonic() - start, 1e-6)
+            except (OSError, FlashError) as e:
+                self._log(f"Block size probe failed for {size} bytes: {e}", "WARNING")
+                continue
+            
+            rate = size * count / elapsed
+            self._log(f"Block size {size}: {rate / (1024 * 1024):.1f} MiB/s", "DEBUG")
+            if rate <= best_rate:
+                break
+            best_size, best_rate = size, rate
+        
+        if best_rate:
+            self._log(f"Auto-tuned block size: {best_size}")
+        else:
+            self._log(f"Block size probe failed, using block size {best_size}", "WARNING")
+        return best_size
+
+    def _probe_write(self, src, dest_fd: int, size: int, count: int, direct: bool) -> None:
+        """Write count blocks of the image head to an open device for timing"""
+        buf = mmap.mmap(-1, size) if direct else bytearray(size)
+        try:
+            src.seek(0)
+            os.lseek(dest_fd, 0, os.SEEK_SET)
+            with memoryview(buf) as view:
+                for _ in range(count):
+                    n = src.readinto(view)
+                    _write_all(dest_fd, view[:n])
+            os.fsync(dest_fd)
+        finally:
+            src.seek(0)
+            os.lseek(dest_fd, 0, os.SEEK_SET)
+            if direct:
+                buf.close()
+
+    def _open_for_write(self, device_path: str, direct_io: bool = False) -> int:
+        """Open a device for writing, with O_DIRECT when requested and supported"""
+        if direct_io:
+            if not hasattr(os, 'O_DIRECT'):
+                self._log("Direct I/O is not supported on this platform", "WARNING")
+            else:
+                try:
+                    return self._open_device(device_path, os.O_WRONLY | os.O_DIRECT)
+                except OSError as e:
+                    if e.errno != 22:
+                        raise
+                    self._log(f"Direct I/O not supported by {device_path}, using buffered writes", "WARNING")
+        return self._open_device(device_path, os.O_WRONLY)
+
+    def _open_for_read(self, device_path: str, direct_io: bool = False) -> Tuple[int, bool]:
+        """Open a device for read-back with its cached pages dropped
+
+        Returns the descriptor and whether it is O_DIRECT. Cached pages are
+        dropped with BLKFLSBUF, or posix_fadvise(DONTNEED) without the
+        privilege for it, so reads are served by the device itself.
+        """
+        fd = self._open_device(device_path, os.O_RDONLY)
+        try:
+            try:
+                fcntl.ioctl(fd, BLKFLSBUF, 0)
+            except PermissionError:
+                if self._helper is None:
+                    raise
+                self._helper.flush(device_path)
+        except (OSError, FlashError):
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except (OSError, AttributeError) as e:
+                self._log(f"Could not drop cached pages of {device_path}: {e}", "WARNING")
+        
+        if not direct_io:
+            return fd, False
+        if not hasattr(os, 'O_DIRECT'):
+            self._log("Direct I/O is not supported on this platform", "WARNING")
+            return fd, False
+        try:
+            direct_fd = self._open_device(device_path, os.O_RDONLY | os.O_DIRECT)
+        except OSError as e:
+            if e.errno != 22:
+                os.close(fd)
+                raise
+            self._log(f"Direct I/O not supported by {device_path}, using buffered reads", "WARNING")
+            return fd, False
+        os.close(fd)
+        return direct_fd, True
+
+    def _pipelined_write(self, src, dest_fd: int, block_size: int, input_size: int,
+                         direct: bool = False, hasher=None, tee=None,
+                         locate: Optional[Callable[[], int]] = None,
+                         delta: Optional[_DeltaWriter] = None,
+                         resumable: Optional[_ResumableWriter] = None) -> int:
+        """Stream src into dest_fd with overlapped reads and writes
+
+        If a hasher is given, every chunk written is also fed to it on a
+        separate thread, so the image is hashed in the same pass. A tee file
+        receives a copy of the stream the same way. input_size may be 0 when
+        the length of src is unknown. With locate (see _WritePipeline) each
+        chunk is written at its own offset. A delta writer replaces the plain
+        write and only writes what differs from the device; a resumable
+        writer sits in front of either one. A _MappedSource is written
+        straight from its mapping unless O_DIRECT, delta or locate need
+        buffers of their own.
+        """
+        observers = []
+        if hasher:
+            observers.append(lambda offset, view: hasher.update(view))
+        if tee:
+            observers.append(lambda offset, view: tee.write(view))
+
+        on_progress = self._write_progress(input_size)
+        write = _direct_write if direct else _write_all
+        read_into = src.readinto
+        writer = lambda offset, view: write(dest_fd, view, offset if locate or resumable else None)
+        if delta:
+            read_into = delta.wrap(read_into, locate)
+            writer = delta
+        if resumable:
+            writer = resumable.wrap(writer)
+        mapped = isinstance(src, _MappedSource) and not (direct or delta or locate)
+        pipeline = _WritePipeline(
+            read_into,
+            writer,
+            block_size,
+            stop_event=self._stop_progress,
+            on_progress=on_progress,
+            aligned=direct,
+            observers=tuple(observers),
+            locate=locate,
+            read_view=src.read_view if mapped else None,
+            release_view=src.release if mapped else None
+        )
+        return pipeline.run()
+    
+    def _write_progress(self, input_size: int) -> Callable[[int], None]:
+        """Progress callback for a write, mapping bytes written onto 10-90%"""
+        last_reported = 0
+
+        def on_progress(bytes_written: int) -> None:
+            nonlocal last_reported
+            self._bytes_written = bytes_written
+            if input_size and bytes_written - last_reported >= 10 * 1024 * 1024:
+                progress = 10 + (bytes_written / input_size) * 80
+                self._progress_update(min(progress, 90), 100)
+                last_reported = bytes_written
+        return on_progress
+    
+    def _zero_copy_write(self, src_fd: int, dest_fd: int, input_size: int,
+                         on_commit: Optional[Callable[[int], None]] = None) -> Optional[int]:
+        """Copy src_fd onto dest_fd inside the kernel, or return None if it cannot
+
+        copy_file_range is tried first and sendfile second, in
+        ZERO_COPY_SLICE pieces so progress, cancellation and checkpoints
+        (on_commit, as in _ResumableWriter) work as they do in the pipeline.
+        If neither primitive supports the pair, nothing useful has been
+        written and the caller falls back to the pipeline.
+        """
+        def sendfile(offset: int, count: int) -> int:
+            # sendfile writes at the destination's file position
+            os.lseek(dest_fd, offset, os.SEEK_SET)
+            return os.sendfile(dest_fd, src_fd, offset, count)
+
+        copiers = []
+        if hasattr(os, 'copy_file_range'):
+            copiers.append(("copy_file_range",
+                            lambda offset, count: os.copy_file_range(src_fd, dest_fd, count, offset, offset)))
+        if hasattr(os, 'sendfile'):
+            copiers.append(("sendfile", sendfile))
+        
+        on_progress = self._write_progress(input_size)
+        offset = 0
+        committed = 0
+        while offset < input_size and copiers and not self._stop_progress.is_set():
+            name, copy = copiers[0]
+            try:
+                copied = copy(offset, min(ZERO_COPY_SLICE, input_size - offset))
+            except OSError as e:
+                if e.errno not in ZERO_COPY_UNSUPPORTED:
+                    raise
+                self._log(f"{name} cannot copy to this device: {e}", "DEBUG")
+                copiers.pop(0)
+                continue
+            if copied == 0:
+                raise IOError(f"Image ended early at byte {offset}")
+            offset += copied
+            on_progress(offset)
+            
+            if on_commit and offset - committed >= FLASH_CHECKPOINT_INTERVAL:
+                os.fsync(dest_fd)
+                committed = offset
+                on_commit(offset)
+        
+        if not copiers:
+            return None
+        if offset >= input_size:
+            self._log(f"Copied {offset} bytes in the kernel with {copiers[0][0]}")
+        return offset
+    
     def _monitor_progress(self):
         """Monitor progress through alternative means"""
         last_bytes = 0
@@ -811,15 +3847,27 @@ class SafeISOFlasher:
             except Exception:
                 time.sleep(1)
     
-    def _verify_flash(self, iso_path: str, device_path: str, expected_checksum: str) -> bool:
-        """Verify that the ISO was correctly flashed to the device"""
+    def _verify_flash(self, iso_path: Optional[str], device_path: str, expected_checksum: str,
+                      written_checksum: str = "", image_size: Optional[int] = None,
+                      extents: Optional[List[Tuple[int, int]]] = None, direct_io: bool = False,
+                      mismatches: Optional[List[Tuple[int, int]]] = None) -> bool:
+        """Verify that the ISO was correctly flashed to the device
+
+        written_checksum is the hash taken while writing; when present only
+        the device is read back and the ISO is not read again. Streamed
+        images have no iso_path and pass image_size instead. A sparse write
+        passes its extents so only the written ranges are read back.
+        The device's cached pages are dropped first so the data really comes
+        from the medium; direct_io reads it back with O_DIRECT as well.
+        If a mismatches list is passed, the (offset, length) of every region
+        that differs from the image is appended to it on failure.
+        """
         try:
             self._log("Starting verification...")
+            verify_start = time.time()
             
-            iso_size = os.path.getsize(iso_path)
-            bytes_compared = 0
-            block_size = 65536  
-            last_reported = 0
+            iso_size = image_size if image_size is not None else os.path.getsize(iso_path)
+            block_size = VERIFY_BLOCK_SIZE
             
             device_size = self._get_device_size(device_path)
             if device_size < iso_size:
@@ -827,38 +3875,21 @@ class SafeISOFlasher:
                 return False
             
             
-            if self.use_sudo and not os.access(device_path, os.R_OK):
-                
-                iso_hash = hashlib.sha256()
-                device_hash = hashlib.sha256()
-                
-                
-                with open(iso_path, "rb") as iso_file:
-                    while True:
-                        chunk = iso_file.read(block_size)
-                        if not chunk:
-                            break
-                        iso_hash.update(chunk)
-                
-                
-                dd_process = subprocess.Popen(
-                    ["sudo", "dd", f"if={device_path}", "bs=4k", "count=1", f"skip={iso_size//4096}", "status=none"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-                stdout, stderr = dd_process.communicate()
-                
-                if dd_process.returncode != 0:
-                    self._log(f"Failed to read device for verification: {stderr.decode()}", "ERROR")
-                    return False
-                
+            if self._needs_dd(device_path, os.R_OK):
                 
+                try:
+                    self._run_command(["blockdev", "--flushbufs", device_path])
+                except FlashError as e:
+                    self._log(f"Could not flush cached pages of {device_path}: {e}", "WARNING")
                 
-                iso_final = iso_hash.hexdigest()
+                iso_final = written_checksum or expected_checksum
+                if not iso_final:
+                    iso_final = _sha256_file(iso_path)
                 
                 
                 dd_process = subprocess.Popen(
-                    ["sudo", "dd", f"if={device_path}", f"bs={block_size}", f"count={iso_size//block_size}", "status=none"],
+                    ["sudo", "dd", f"if={device_path}", f"bs={block_size}", f"count={iso_size}",
+                     "iflag=count_bytes", "status=none"],
                     stdout=subprocess.PIPE
                 )
                 sha_process = subprocess.Popen(
@@ -876,44 +3907,23 @@ class SafeISOFlasher:
                 
                 device_final = stdout.decode().split()[0]
                 
+            elif written_checksum:
+                
+                iso_final = written_checksum
+                device_final = self._hash_device(device_path, iso_size, extents=extents, direct_io=direct_io)
+                
             else:
                 
-                with open(iso_path, "rb") as iso_file, open(device_path, "rb") as device_file:
-                    iso_hash = hashlib.sha256()
-                    device_hash = hashlib.sha256()
-            
-                    while bytes_compared < iso_size:
-                        bytes_to_read = min(block_size, iso_size - bytes_compared)
-                        iso_chunk = iso_file.read(bytes_to_read)
-                        device_chunk = device_file.read(bytes_to_read)
-                        
-                        if not iso_chunk or not device_chunk:
-                            break
-                        
-                        if iso_chunk != device_chunk:
-                            for i in range(len(iso_chunk)):
-                                if i >= len(device_chunk) or iso_chunk[i] != device_chunk[i]:
-                                    position = bytes_compared + i
-                                    self._log(
-                                        f"Data mismatch at byte {position}: "
-                                        f"ISO=0x{iso_chunk[i]:02x}, Device=0x{device_chunk[i]:02x}",
-                                        "ERROR"
-                                    )
-                                    return False
-                            self._log("Data mismatch detected (different chunk sizes).", "ERROR")
-                            return False
-                        
-                        iso_hash.update(iso_chunk)
-                        device_hash.update(device_chunk)
-                        bytes_compared += len(iso_chunk)
-                        
-                        if bytes_compared - last_reported >= 10 * 1024 * 1024:
-                            progress = 95 + (bytes_compared / iso_size) * 5
-                            self._progress_update(min(progress, 100), 100)
-                            last_reported = bytes_compared
-                    
-                    iso_final = iso_hash.hexdigest()
-                    device_final = device_hash.hexdigest()
+                device_hash = hashlib.sha256()
+                found = self._compare_with_source(iso_path, device_path, extents or [(0, iso_size)],
+                                                  direct_io, hasher=device_hash)
+                if found:
+                    if mismatches is not None:
+                        mismatches.extend(found)
+                    return False
+                
+                # Every byte matched, so the image and device hashes are the same
+                iso_final = device_final = device_hash.hexdigest()
             
             self._log(f"ISO checksum: {iso_final}")
             self._log(f"Device checksum: {device_final}")
@@ -923,6 +3933,10 @@ class SafeISOFlasher:
                     f"Verification failed: checksum mismatch "
                     f"(ISO: {iso_final[:16]}..., Device: {device_final[:16]}...)", "ERROR"
                 )
+                if mismatches is not None and iso_path and not self._needs_dd(device_path, os.R_OK):
+                    self._log("Comparing the device with the image to locate the damage...")
+                    mismatches.extend(self._compare_with_source(iso_path, device_path,
+                                                                extents or [(0, iso_size)], direct_io))
                 return False
             
             if expected_checksum and device_final != expected_checksum:
@@ -932,7 +3946,10 @@ class SafeISOFlasher:
                 )
                 return False
             
-            self._log("Verification passed!")
+            elapsed = time.time() - verify_start
+            verified = sum(length for _, length in extents) if extents else iso_size
+            self._log(f"Verification passed! Read back {verified // (1024 * 1024)} MiB in {elapsed:.1f}s "
+                      f"({verified / (1024 * 1024) / max(elapsed, 1e-6):.1f} MiB/s)")
             return True
                 
         except Exception as e:
@@ -941,14 +3958,234 @@ class SafeISOFlasher:
             self._log(f"Traceback: {traceback.format_exc()}", "DEBUG")
             return False
     
-    def _safe_sync(self):
-        """Safely sync all writes to disk"""
+    def _repair_extents(self, iso_path: str, device_path: str, mismatches: List[Tuple[int, int]],
+                        retries: int, direct_io: bool = False) -> Tuple[bool, int, int]:
+        """Rewrite and re-check only the regions that failed verification
+
+        Each pass rewrites the regions still bad from the image and compares
+        just those regions again, up to retries passes. Returns whether the
+        device now matches, the bytes rewritten and the passes used.
+        """
+        if self._needs_dd(device_path, os.W_OK):
+            self._log("Repairing needs direct device access, not attempted", "WARNING")
+            return False, 0, 0
+        
+        pending = list(mismatches)
+        repaired = 0
+        for attempt in range(1, retries + 1):
+            self._log(f"Repair pass {attempt}/{retries}: rewriting {len(pending)} region(s), "
+                      f"{sum(length for _, length in pending)} bytes")
+            try:
+                repaired += self._rewrite_extents(iso_path, device_path, pending)
+                pending = self._compare_with_source(iso_path, device_path, pending, direct_io)
+            except Exception as e:
+                self._log(f"Repair failed: {e}", "ERROR")
+                return False, repaired, attempt
+            if not pending:
+                self._log(f"Repair succeeded: {repaired} bytes rewritten in {attempt} pass(es)")
+                return True, repaired, attempt
+        
+        self._log(f"Giving up after {retries} repair pass(es); {len(pending)} region(s) still differ", "ERROR")
+        return False, repaired, retries
+    
+    def _rewrite_extents(self, iso_path: str, device_path: str, extents: List[Tuple[int, int]]) -> int:
+        """Copy the given extents of the image onto the device, returning the bytes written"""
+        with open(iso_path, "rb") as f:
+            compression = detect_compression(f.read(8))
+        if compression:
+            source = _DecompressingReader(iso_path, compression)
+        else:
+            source = _MappedSource(iso_path)
+        written = 0
+        buf = bytearray(VERIFY_BLOCK_SIZE)
+        with source as src, memoryview(buf) as view:
+            reader = _ExtentReader(src, extents)
+            dest_fd = self._open_device(device_path, os.O_WRONLY)
+            try:
+                while True:
+                    n = reader.readinto(view)
+                    if not n:
+                        break
+                    _write_all(dest_fd, view[:n], reader.offset)
+                    written += n
+                os.fsync(dest_fd)
+            finally:
+                os.close(dest_fd)
+        return written
+    
+    def _compare_with_source(self, iso_path: str, device_path: str, extents: List[Tuple[int, int]],
+                             direct_io: bool = False, hasher=None) -> List[Tuple[int, int]]:
+        """Compare device extents with the image and return the regions that differ
+
+        A compressed image is decompressed as it is compared; only the given
+        extents of it are used.
+        """
+        with open(iso_path, "rb") as f:
+            compression = detect_compression(f.read(8))
+        if compression:
+            source = _DecompressingReader(iso_path, compression)
+        else:
+            source = _MappedSource(iso_path)
+        with source as src:
+            if compression:
+                total = sum(length for _, length in extents)
+                stream = src if extents == [(0, total)] else _ExtentReader(src, extents)
+            device_fd, direct = self._open_for_read(device_path, direct_io)
+            try:
+                pipeline = _VerifyPipeline(
+                    device_fd, extents, source=stream if compression else src, hasher=hasher,
+                    on_progress=self._verify_progress(sum(length for _, length in extents)),
+                    direct=direct
+                )
+                found = pipeline.run()
+            finally:
+                os.close(device_fd)
+        
+        if found:
+            bad_bytes = sum(length for _, length in found)
+            first_start, first_length = found[0]
+            self._log(
+                f"Data mismatch in {len(found)}{'+' if pipeline.truncated else ''} region(s), "
+                f"{bad_bytes} bytes in total; first at byte {first_start} ({first_length} bytes)", "ERROR"
+            )
+            for start, length in found[:20]:
+                self._log(f"Mismatch: bytes {start}-{start + length - 1}", "DEBUG")
+        return found
+    
+    def _hash_device(self, device_path: str, length: int, block_size: int = VERIFY_BLOCK_SIZE,
+                     extents: Optional[List[Tuple[int, int]]] = None, direct_io: bool = False) -> str:
+        """SHA-256 of the first length bytes of a device, or of the given extents"""
+        if extents is None:
+            extents = [(0, length)]
+        device_hash = hashlib.sha256()
+        device_fd, direct = self._open_for_read(device_path, direct_io)
         try:
-            for _ in range(2):  
-                self._run_command(["sync"], check=False)
-                time.sleep(1)
+            _VerifyPipeline(
+                device_fd, extents, block_size=block_size, hasher=device_hash,
+                on_progress=self._verify_progress(sum(size for _, size in extents)),
+                direct=direct
+            ).run()
+        finally:
+            os.close(device_fd)
+        return device_hash.hexdigest()
+    
+    def _verify_mode(self, verify: Union[bool, str]) -> str:
+        """Map the verify argument onto a mode name: full, sample or none
+
+        True means "full" and False "none". A sampled check reads back the
+        boot regions plus random windows (see _verify_sampled).
+        """
+        if verify is True:
+            return "full"
+        if verify is False or verify is None:
+            return "none"
+        if verify not in ("full", "sample", "none"):
+            raise FlashError(f"Unknown verification mode: {verify}")
+        return verify
+    
+    def _sampling_fallback(self, verify_mode: str, iso_validation: Dict[str, Any], device: str) -> str:
+        """Switch sampled verification to full when it cannot seek in the image or device"""
+        if verify_mode != "sample":
+            return verify_mode
+        if iso_validation["compression"] or self._needs_dd(device, os.R_OK):
+            self._log("Sampled verification needs random access to the image and device, "
+                      "verifying in full", "WARNING")
+            return "full"
+        return verify_mode
+    
+    def _verify_sampled(self, iso_path: str, device_path: str, image_size: int, coverage: float,
+                        extents: Optional[List[Tuple[int, int]]] = None, direct_io: bool = False,
+                        seed: str = "") -> Dict[str, Any]:
+        """Compare a deterministic sample of the device with the image
+
+        The sample always includes the partition tables and boot sectors
+        and is topped up with random windows to the requested coverage.
+        Returns "ok", the "coverage" achieved and the "confidence", i.e. the
+        chance the sample would have caught damage to SAMPLE_DAMAGE_FRACTION
+        of the image.
+        """
+        outcome = {"ok": False, "coverage": 0.0, "confidence": 0.0, "mismatches": []}
+        if not 0 < coverage <= 1:
+            raise FlashError(f"Sample coverage must be between 0 and 1, got {coverage}")
+        try:
+            verify_start = time.time()
+            with open(iso_path, "rb", buffering=0) as iso_file:
+                required = image_boot_regions(iso_file.fileno(), image_size)
+                windows, drawn = sample_windows(image_size, coverage, required, seed=seed)
+                written = extents or [(0, image_size)]
+                windows = _intersect_extents(windows, written)
+                sampled = sum(length for _, length in windows)
+                
+                self._log(f"Sampling {len(windows)} region(s), {drawn} random "
+                          f"{SAMPLE_WINDOW_SIZE // (1024 * 1024)} MiB window(s)")
+            outcome["mismatches"] = self._compare_with_source(iso_path, device_path, windows, direct_io)
+            if outcome["mismatches"]:
+                return outcome
+            
+            outcome["coverage"] = sampled / max(1, sum(length for _, length in written))
+            windows_checked = -(-sampled // SAMPLE_WINDOW_SIZE)
+            outcome["confidence"] = 1.0 if outcome["coverage"] >= 1 else \
+                1 - (1 - SAMPLE_DAMAGE_FRACTION) ** windows_checked
+            outcome["ok"] = True
+            self._log(f"Sampled verification passed: {outcome['coverage']:.1%} coverage in "
+                      f"{time.time() - verify_start:.1f}s, {outcome['confidence']:.2%} chance of catching "
+                      f"damage to {SAMPLE_DAMAGE_FRACTION:.0%} of the image")
         except Exception as e:
-            self._log(f"Error during sync: {e}", "WARNING")
+            self._log(f"Verification error: {e}", "ERROR")
+        return outcome
+    
+    def _verify_progress(self, total: int) -> Callable[[int], None]:
+        """Progress callback mapping verified bytes onto the last 5% of the bar"""
+        last_reported = 0
+        
+        def on_progress(bytes_verified: int) -> None:
+            nonlocal last_reported
+            if bytes_verified - last_reported >= 10 * 1024 * 1024:
+                progress = 95 + (bytes_verified / total) * 5
+                self._progress_update(min(progress, 100), 100)
+                last_reported = bytes_verified
+        return on_progress
+    
+    def _flush_device(self, device_path: str) -> float:
+        """Make writes to one device durable and return how long it took
+
+        fsync() writes back the device's dirty pages and flushes its cache,
+        then BLKFLSBUF drops its buffers. Unlike a global sync this leaves
+        every other filesystem on the host alone. Without the privilege to
+        open the device, the privileged helper or else blockdev --flushbufs
+        through sudo does the same.
+        """
+        self._log(f"Flushing writes to {device_path}...")
+        start = time.monotonic()
+        helper = None
+        try:
+            fd = os.open(device_path, os.O_RDONLY)
+        except OSError as e:
+            fd = None
+            helper = self._privileged_helper()
+            if not self.use_sudo:
+                self._log(f"Could not open {device_path} to flush it: {e}", "WARNING")
+        
+        try:
+            if fd is not None:
+                os.fsync(fd)
+                try:
+                    fcntl.ioctl(fd, BLKFLSBUF, 0)
+                except OSError as e:
+                    self._log(f"Could not drop buffers of {device_path}: {e}", "DEBUG")
+            elif helper is not None:
+                helper.flush(device_path)
+            elif self.use_sudo:
+                self._run_command(["blockdev", "--flushbufs", device_path], check=False)
+        except (OSError, FlashError) as e:
+            self._log(f"Error flushing {device_path}: {e}", "WARNING")
+        finally:
+            if fd is not None:
+                os.close(fd)
+        
+        duration = time.monotonic() - start
+        self._log(f"Flushed {device_path} in {duration:.2f}s")
+        return duration
     
     def cancel_flash(self) -> bool:
         """Cancel the current flash operation"""
@@ -956,4 +4193,170 @@ class SafeISOFlasher:
         self._cancelled = True
         self._set_status(FlashStatus.CANCELLED)
         self._log("Flash operation cancelled by user")
-        return True
\ No newline at end of file
+        return True
+
+
+class DeviceMonitor:
+    """Keep a table of USB block devices current from kernel hotplug events
+
+    Uevents are read from a NETLINK_KOBJECT_UEVENT socket; where that is not
+    available (non-Linux, some containers) /sys/block or, failing that, the
+    flasher's device list is polled and the differences are turned into the
+    same events. Only whole disks are tracked, each one described once
+    when it appears. on_add receives the new USBDevice and on_remove the
+    one that went away; both run on the monitor thread.
+
+    handle_uevent() accepts a raw uevent message, so synthetic events can be
+    fed in without hardware, and describe replaces the per-device lookup.
+    """
+
+    def __init__(self, flasher: SafeISOFlasher,
+                 on_add: Optional[Callable[[USBDevice], None]] = None,
+                 on_remove: Optional[Callable[[USBDevice], None]] = None,
+                 poll_interval: float = 1.0, use_netlink: bool = True,
+                 describe: Optional[Callable[[str], Optional[USBDevice]]] = None,
+                 settle_timeout: float = 2.0):
+        self.flasher = flasher
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.poll_interval = poll_interval
+        self.use_netlink = use_netlink
+        self.settle_timeout = settle_timeout
+        self._describe = describe or flasher.describe_usb_device
+        self._devices = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def devices(self) -> List[USBDevice]:
+        """Current USB devices, sorted by device path"""
+        with self._lock:
+            return [self._devices[path] for path in sorted(self._devices)]
+
+    def start(self) -> None:
+        """Populate the table and start following hotplug events"""
+        self.rescan()
+        self._stop.clear()
+        sock = self._open_netlink() if self.use_netlink else None
+        target = self._netlink_loop if sock else self._poll_loop
+        self._thread = threading.Thread(target=target, args=(sock,) if sock else (),
+                                        name="device-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop following events"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def rescan(self) -> None:
+        """Re-enumerate every device and apply the differences"""
+        current = {device.device: device for device in self.flasher.list_usb_devices()}
+        with self._lock:
+            known = dict(self._devices)
+        for path in known.keys() - current.keys():
+            self._remove(path)
+        for path in current.keys() - known.keys():
+            self._add(current[path])
+
+    def handle_uevent(self, message: bytes) -> None:
+        """Apply one kernel uevent message (``action@devpath\\0KEY=value\\0...``)"""
+        fields = {}
+        for part in message.split(b'\0'):
+            key, sep, value = part.partition(b'=')
+            if sep:
+                fields[key.decode(errors='replace')] = value.decode(errors='replace')
+        if fields.get('SUBSYSTEM') != 'block' or fields.get('DEVTYPE', 'disk') != 'disk':
+            return
+        name = fields.get('DEVNAME') or os.path.basename(fields.get('DEVPATH', ''))
+        if not name:
+            return
+        path = name if name.startswith('/dev/') else f"/dev/{name}"
+        action = fields.get('ACTION')
+        
+        if action == 'remove':
+            self._remove(path)
+        elif action in ('add', 'change'):
+            if action == 'add':
+                self._wait_for_node(path)
+            device = self._describe(path)
+            with self._lock:
+                known = path in self._devices
+            if device and not known:
+                self._add(device)
+            elif device:
+                with self._lock:
+                    self._devices[path] = device
+            elif known:
+                # e.g. the medium was taken out of a card reader
+                self._remove(path)
+
+    def _add(self, device: USBDevice) -> None:
+        with self._lock:
+            self._devices[device.device] = device
+        logger.info(f"USB device added: {device.device}")
+        if self.on_add:
+            self.on_add(device)
+
+    def _remove(self, path: str) -> None:
+        self.flasher.forget_device(path)
+        with self._lock:
+            device = self._devices.pop(path, None)
+        if device is None:
+            return
+        logger.info(f"USB device removed: {path}")
+        if self.on_remove:
+            self.on_remove(device)
+
+    def _wait_for_node(self, path: str) -> None:
+        """Give udev a moment to create the device node after a kernel add event"""
+        deadline = time.time() + self.settle_timeout
+        while not os.path.exists(path) and time.time() < deadline and not self._stop.is_set():
+            time.sleep(0.05)
+
+    def _open_netlink(self):
+        if not hasattr(socket, 'NETLINK_KOBJECT_UEVENT'):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, socket.NETLINK_KOBJECT_UEVENT)
+            # Group 1 carries the kernel's own events
+            sock.bind((0, 1))
+            return sock
+        except OSError as e:
+            logger.debug(f"Netlink uevents unavailable, polling instead: {e}")
+            return None
+
+    def _netlink_loop(self, sock) -> None:
+        with sock:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([sock], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    message = sock.recv(16384)
+                except OSError as e:
+                    logger.debug(f"Uevent socket error: {e}")
+                    continue
+                try:
+                    self.handle_uevent(message)
+                except Exception as e:
+                    logger.debug(f"Error handling uevent: {e}")
+
+    def _poll_loop(self) -> None:
+        sys_block = os.path.join(self.flasher.sysfs_root, 'block')
+        seen = set(os.listdir(sys_block)) if os.path.isdir(sys_block) else None
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if seen is None:
+                    self.rescan()
+                    continue
+                names = set(os.listdir(sys_block))
+                for name in sorted(seen - names):
+                    self.handle_uevent(f"ACTION=remove\0SUBSYSTEM=block\0DEVTYPE=disk\0DEVNAME={name}".encode())
+                for name in sorted(names - seen):
+                    self.handle_uevent(f"ACTION=add\0SUBSYSTEM=block\0DEVTYPE=disk\0DEVNAME={name}".encode())
+                seen = names
+            except Exception as e:
+                logger.debug(f"Error polling for devices: {e}")
@@ -0,0 +1,110 @@
+"""Privileged side of PicoFlasher's device access
+
+Started as root by PrivilegedHelper (flash.py) through sudo or pkexec, with
+the path of a Unix socket to connect back to. It serves open, flush and
+umount requests, passing opened descriptors back over SCM_RIGHTS. Requests
+are only honoured for whole-disk block devices that are removable or sit on
+a USB bus and also pass the flasher's target checks; internal disks are
+refused whatever the client asks. It exits when the connection closes.
+"""
+import os
+import sys
+import stat
+import socket
+import fcntl
+from typing import Dict, Any, Optional, Tuple
+
+from flash import SafeISOFlasher, FlashError, BLKFLSBUF, _send_message, _recv_message, _umount_order
+
+# The only open() flags a client may ask for
+ALLOWED_FLAGS = os.O_RDONLY | os.O_WRONLY | os.O_RDWR | getattr(os, 'O_DIRECT', 0) | os.O_SYNC | os.O_DSYNC
+
+
+def _check_device(flasher: SafeISOFlasher, path: str) -> str:
+    """Resolve path and make sure it is a removable or USB disk the flasher would write to"""
+    real = os.path.realpath(path)
+    if not real.startswith('/dev/') or not stat.S_ISBLK(os.stat(real).st_mode):
+        raise FlashError(f"Not a block device: {path}")
+    # The client is unprivileged, so the helper enforces the policy itself
+    if not flasher._is_usb_device_linux(real):
+        raise FlashError(f"Refusing to access {path}: not a removable or USB device")
+    if not flasher._validate_target_device(real):
+        raise FlashError(f"Refusing to access {path}: not a valid target device")
+    return real
+
+
+def handle(flasher: SafeISOFlasher, request: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[int]]:
+    """Carry out one request, returning the reply and any descriptor to send with it"""
+    op = request.get("op")
+    path = _check_device(flasher, str(request.get("path", "")))
+
+    if op == "open":
+        flags = int(request.get("flags", os.O_RDONLY))
+        if flags & ~ALLOWED_FLAGS:
+            raise FlashError(f"Unsupported open flags: {flags:#o}")
+        return {"ok": True}, os.open(path, flags | os.O_CLOEXEC)
+
+    if op == "flush":
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            os.fsync(fd)
+            fcntl.ioctl(fd, BLKFLSBUF, 0)
+        finally:
+            os.close(fd)
+        return {"ok": True}, None
+
+    if op == "umount":
+        mounted = flasher._device_mountpoints(path)
+        if mounted:
+            completed = flasher._run_command(["umount"] + (["-f"] if request.get("force") else []) +
+                                             _umount_order(mounted), check=False)
+            if completed.returncode != 0:
+                return {"ok": False, "error": completed.stderr.strip() or "umount failed"}, None
+        return {"ok": True}, None
+
+    raise FlashError(f"Unknown request: {op}")
+
+
+def serve(sock: socket.socket) -> None:
+    """Answer requests until the client hangs up or says quit"""
+    flasher = SafeISOFlasher(use_sudo=False)
+    while True:
+        request, stray = _recv_message(sock)
+        if stray is not None:
+            os.close(stray)
+        if request is None or request.get("op") == "quit":
+            return
+
+        fd = None
+        try:
+            reply, fd = handle(flasher, request)
+        except OSError as e:
+            reply = {"ok": False, "error": str(e), "errno": e.errno}
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        try:
+            _send_message(sock, reply, fd)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+
+def main() -> int:
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} SOCKET", file=sys.stderr)
+        return 2
+    if os.geteuid() != 0:
+        print("flash_helper must run as root", file=sys.stderr)
+        return 1
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(sys.argv[1])
+        serve(sock)
+    finally:
+        sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,7 +21,11 @@ def open_file_dialog():
     root.withdraw()  
     filepath = filedialog.askopenfilename(
         title="Select ISO File",
-        filetypes=[("ISO files", "*.iso"), ("All files", "*.*")]
+        filetypes=[
+            ("Disk images", " ".join(f"*{ext}" for ext in SUPPORTED_IMAGE_EXTENSIONS)),
+            ("ISO files", "*.iso"),
+            ("All files", "*.*")
+        ]
     )
     root.destroy()
     return filepath
@@ -104,7 +108,7 @@ def textbox_placeholder_callback(text):
 @GooeyButtonCallback
 def flash_callback() -> None:
     """Callback for the flash button"""
-    global flash_in_progress, selected_device
+    global flash_in_progress, selected_device, iso_url
     iso_url = GooeyTextbox_GetText(iso_url_textbox).strip()
     print(f"ISO URL: {iso_url}")
     if flash_in_progress:
@@ -132,8 +136,8 @@ def browse_iso() -> None:
     filepath = open_file_dialog()
     if filepath:
 
-        if not filepath.lower().endswith('.iso'):
-            update_status("Please select a valid ISO file")
+        if not filepath.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS):
+            update_status("Please select a valid ISO or disk image file")
             return
             
         filename = filepath.split("/")[-1]
@@ -147,7 +151,9 @@ def browse_iso() -> None:
         
         
         validation = flasher.validate_iso(iso_path)
-        if validation["valid"]:
+        if validation["valid"] and validation["compression"] and not validation["size"]:
+            update_status(f"Image validated: {validation['compression']} compressed, size unknown")
+        elif validation["valid"]:
             size_gb = validation["size"] / (1024**3)
             update_status(f"ISO validated: {size_gb:.2f} GB")
         else:
@@ -185,12 +191,11 @@ def dropdown_callback(index) -> None:
         selected_device = None
         update_status("No device selected")
 
-def refresh_devices():
-    """Refresh the list of USB devices"""
-    global device_dropdown, selected_device, devices, dropdown_options
+def update_device_dropdown():
+    """Rebuild the dropdown from the monitor's device table"""
+    global device_dropdown, devices, dropdown_options
     
-    update_status("Refreshing devices...")
-    devices = flasher.list_usb_devices()
+    devices = device_monitor.devices
     
     
     dropdown_options = ["No device selected"]
@@ -201,6 +206,35 @@ def refresh_devices():
     dropdown_options.extend(device_names)
     
     GooeyDropdown_Update(device_dropdown, dropdown_options, len(dropdown_options))
+
+def device_added(device):
+    """Hotplug callback for a newly connected device"""
+    global selected_device
+    
+    update_device_dropdown()
+    if not flash_in_progress:
+        # Dropdown indices have shifted, so the old selection no longer lines up
+        selected_device = None
+    update_status(f"USB device added: {device.device} ({device.vendor} {device.model})")
+
+def device_removed(device):
+    """Hotplug callback for a disconnected device"""
+    global selected_device
+    
+    update_device_dropdown()
+    if selected_device == device.device or not flash_in_progress:
+        selected_device = None
+    update_status(f"USB device removed: {device.device}")
+
+device_monitor = DeviceMonitor(flasher, on_add=device_added, on_remove=device_removed)
+
+def refresh_devices():
+    """Refresh the list of USB devices"""
+    global selected_device
+    
+    update_status("Refreshing devices...")
+    device_monitor.rescan()
+    update_device_dropdown()
     
     
     selected_device = None
@@ -208,7 +242,7 @@ def refresh_devices():
     if devices:
         update_status(f"Found {len(devices)} device(s). Please select one from the dropdown")
     else:
-        update_status("No USB devices found. Please connect a USB device and click Refresh")
+        update_status("No USB devices found. Please connect a USB device")
 
 def main():
     global iso_path_label, progress_bar, status_label, flash_button, browse_button, device_dropdown, refresh_button, win
@@ -311,14 +345,17 @@ def main():
     GooeyCanvas_DrawRectangle(status_bg, 0, 0, 580, 30, 0xBDBDBD, False, 1.0, True, 1.0)
     GooeyWindow_RegisterWidget(win, status_bg)
     
-    status_label = GooeyLabel_Create("Ready. Click Refresh to find devices", 0.3, 20, 630)
+    status_label = GooeyLabel_Create("Ready. Connect a USB device to begin", 0.3, 20, 630)
     GooeyLabel_SetColor(status_label, 0x424242)
     GooeyWindow_RegisterWidget(win, status_label)
     GooeyWindow_RegisterWidget(win, iso_section)
 
+    device_monitor.start()
     refresh_devices()
     
     GooeyWindow_Run(1, win)
+    device_monitor.stop()
+    flasher.close()
     GooeyWindow_Cleanup(1, win)
 
 if __name__ == "__main__":
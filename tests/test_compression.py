@@ -0,0 +1,49 @@
+"""Uncompressed size lookup from xz and zstd container metadata"""
+import lzma
+import struct
+
+from flash import image_uncompressed_size
+
+
+def zstd_frame(payload, block_size=1000):
+    """A zstd frame of raw blocks with a 4-byte content size"""
+    frame = struct.pack('<I', 0xFD2FB528) + bytes([0b10100000]) + struct.pack('<I', len(payload))
+    blocks = [payload[i:i + block_size] for i in range(0, len(payload), block_size)] or [b'']
+    for index, block in enumerate(blocks):
+        last = index == len(blocks) - 1
+        frame += (len(block) << 3 | int(last)).to_bytes(3, 'little') + block
+    return frame
+
+
+def test_xz_size_spans_streams_and_padding(tmp_path):
+    path = tmp_path / "image.xz"
+    path.write_bytes(lzma.compress(b'a' * 5000) + b'\0' * 8 + lzma.compress(b'b' * 3000))
+    assert image_uncompressed_size(str(path), 'xz') == 8000
+
+
+def test_truncated_xz_has_no_size(tmp_path):
+    path = tmp_path / "image.xz"
+    path.write_bytes(lzma.compress(bytes(range(256)) * 100)[:-20])
+    assert image_uncompressed_size(str(path), 'xz') is None
+
+
+def test_zstd_size_sums_frames(tmp_path):
+    path = tmp_path / "image.zst"
+    skippable = struct.pack('<II', 0x184D2A50, 4) + b'meta'
+    path.write_bytes(zstd_frame(b'x' * 4500) + skippable + zstd_frame(b'y' * 700))
+    assert image_uncompressed_size(str(path), 'zstd') == 5200
+
+
+def test_truncated_zstd_has_no_size(tmp_path):
+    frame = zstd_frame(b'x' * 4500)
+    path = tmp_path / "image.zst"
+    # Cut inside a block, at a block header and inside the frame header
+    for length in (2500, 2 * 1003 + 9, 7):
+        path.write_bytes(frame[:length])
+        assert image_uncompressed_size(str(path), 'zstd') is None
+
+
+def test_zstd_without_content_size(tmp_path):
+    path = tmp_path / "image.zst"
+    path.write_bytes(struct.pack('<I', 0xFD2FB528) + bytes([0b00000000, 0]) + (1).to_bytes(3, 'little'))
+    assert image_uncompressed_size(str(path), 'zstd') is None
@@ -0,0 +1,99 @@
+"""DeviceMonitor driven by synthetic uevents"""
+import pytest
+
+from flash import SafeISOFlasher, DeviceMonitor, USBDevice, ChecksumCache, FlashJournal
+
+
+def uevent(action, name, devtype="disk", subsystem="block"):
+    return (f"{action}@/devices/virtual/block/{name}\0ACTION={action}\0SUBSYSTEM={subsystem}\0"
+            f"DEVNAME={name}\0DEVTYPE={devtype}\0").encode()
+
+
+def usb_device(path, size=8 * 1024 ** 3):
+    return USBDevice(device=path, mountpoint="", total_size=size, used=0, free=size, filesystem="")
+
+
+@pytest.fixture
+def media():
+    """Device paths with a medium present, mapped to their description"""
+    return {}
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def monitor(tmp_path, media, events):
+    flasher = SafeISOFlasher(use_sudo=False, sysfs_root=str(tmp_path),
+                             checksum_cache=ChecksumCache(str(tmp_path / 'c.json')),
+                             flash_journal=FlashJournal(str(tmp_path / 'j.json')))
+    return DeviceMonitor(flasher, use_netlink=False, settle_timeout=0,
+                         describe=media.get,
+                         on_add=lambda device: events.append(("add", device.device)),
+                         on_remove=lambda device: events.append(("remove", device.device)))
+
+
+def test_add_event(monitor, media, events):
+    media["/dev/sdb"] = usb_device("/dev/sdb")
+    monitor.handle_uevent(uevent("add", "sdb"))
+    assert [device.device for device in monitor.devices] == ["/dev/sdb"]
+    assert events == [("add", "/dev/sdb")]
+
+    # A repeated add is not reported twice
+    monitor.handle_uevent(uevent("add", "sdb"))
+    assert events == [("add", "/dev/sdb")]
+
+
+def test_add_event_for_unsuitable_device(monitor, events):
+    monitor.handle_uevent(uevent("add", "sda"))
+    assert monitor.devices == []
+    assert events == []
+
+
+def test_change_event_for_removed_medium(monitor, media, events):
+    media["/dev/sdc"] = usb_device("/dev/sdc")
+    monitor.handle_uevent(uevent("add", "sdc"))
+
+    # The card is taken out of the reader: the disk stays but describes as nothing
+    del media["/dev/sdc"]
+    monitor.handle_uevent(uevent("change", "sdc"))
+    assert monitor.devices == []
+    assert events == [("add", "/dev/sdc"), ("remove", "/dev/sdc")]
+
+    # ...and put back in
+    media["/dev/sdc"] = usb_device("/dev/sdc", size=16 * 1024 ** 3)
+    monitor.handle_uevent(uevent("change", "sdc"))
+    assert monitor.devices[0].total_size == 16 * 1024 ** 3
+    assert events[-1] == ("add", "/dev/sdc")
+
+
+def test_change_event_updates_description(monitor, media, events):
+    media["/dev/sdb"] = usb_device("/dev/sdb")
+    monitor.handle_uevent(uevent("add", "sdb"))
+    media["/dev/sdb"] = usb_device("/dev/sdb", size=4 * 1024 ** 3)
+    monitor.handle_uevent(uevent("change", "sdb"))
+    assert monitor.devices[0].total_size == 4 * 1024 ** 3
+    assert events == [("add", "/dev/sdb")]
+
+
+def test_remove_event(monitor, media, events):
+    media["/dev/sdb"] = usb_device("/dev/sdb")
+    monitor.handle_uevent(uevent("add", "sdb"))
+    monitor.handle_uevent(uevent("remove", "sdb"))
+    assert monitor.devices == []
+    assert events == [("add", "/dev/sdb"), ("remove", "/dev/sdb")]
+
+
+def test_partition_and_other_subsystem_events_are_ignored(monitor, media, events):
+    media["/dev/sdb1"] = usb_device("/dev/sdb1")
+    media["/dev/sdb"] = usb_device("/dev/sdb")
+    monitor.handle_uevent(uevent("add", "sdb1", devtype="partition"))
+    monitor.handle_uevent(uevent("add", "sdb", subsystem="scsi"))
+    assert monitor.devices == []
+
+    monitor.handle_uevent(uevent("add", "sdb"))
+    monitor.handle_uevent(uevent("remove", "sdb1", devtype="partition"))
+    assert [device.device for device in monitor.devices] == ["/dev/sdb"]
+    assert events == [("add", "/dev/sdb")]
@@ -0,0 +1,45 @@
+"""Extent list arithmetic used by sampled verification and mismatch reports"""
+import os
+
+from flash import _merge_extents, _intersect_extents, _diff_extents
+
+
+def test_merge_extents_joins_overlapping_and_touching():
+    extents = [(100, 50), (0, 10), (10, 5), (120, 100), (300, 0), (400, 10)]
+    assert _merge_extents(extents) == [(0, 15), (100, 120), (400, 10)]
+
+
+def test_merge_extents_keeps_contained_extents_whole():
+    assert _merge_extents([(0, 100), (10, 5)]) == [(0, 100)]
+    assert _merge_extents([]) == []
+
+
+def test_intersect_extents():
+    a = [(0, 100), (200, 100), (500, 10)]
+    b = [(50, 200), (290, 300)]
+    assert _intersect_extents(a, b) == [(50, 50), (200, 50), (290, 10), (500, 10)]
+
+
+def test_intersect_extents_disjoint():
+    assert _intersect_extents([(0, 10)], [(10, 10)]) == []
+    assert _intersect_extents([], [(0, 10)]) == []
+
+
+def test_diff_extents_finds_each_damaged_region():
+    a = bytearray(os.urandom(64 * 1024))
+    b = bytearray(a)
+    b[1000] ^= 0xFF
+    b[1030] ^= 0xFF
+    b[40000:41000] = bytes(byte ^ 0xFF for byte in a[40000:41000])
+    # 1000 and 1030 fall in neighbouring 512-byte blocks
+    assert _diff_extents(memoryview(a), memoryview(b), 512) == [(512, 1024), (39936, 1536)]
+
+
+def test_diff_extents_identical_buffers():
+    data = os.urandom(8192)
+    assert _diff_extents(memoryview(data), memoryview(data), 512) == []
+
+
+def test_diff_extents_length_mismatch():
+    data = bytes(4096)
+    assert _diff_extents(memoryview(data), memoryview(data[:3000]), 512) == [(3000, 1096)]
@@ -0,0 +1,150 @@
+"""bmap parsing, mapped-extent reads and hole detection for sparse writes"""
+import hashlib
+import io
+import os
+
+import pytest
+
+from flash import parse_bmap, _ExtentReader, _file_data_extents, FlashError
+
+BLOCK = 4096
+
+
+def write_bmap(path, image, ranges, version="2.0", corrupt=False):
+    """Write a bmap for image mapping the given (first, last) block ranges"""
+    checksum_type = "sha256" if version.startswith("2") else "sha1"
+    digest_size = hashlib.new(checksum_type).digest_size * 2
+    lines = [
+        '<?xml version="1.0" ?>',
+        f'<bmap version="{version}">',
+        f'    <ImageSize> {len(image)} </ImageSize>',
+        f'    <BlockSize> {BLOCK} </BlockSize>',
+        f'    <BlocksCount> {(len(image) + BLOCK - 1) // BLOCK} </BlocksCount>',
+    ]
+    if version.startswith("2"):
+        lines.append(f'    <ChecksumType> {checksum_type} </ChecksumType>')
+    lines.append(f'    <BmapFileChecksum> {"0" * digest_size} </BmapFileChecksum>')
+    lines.append('    <BlockMap>')
+    for first, last in ranges:
+        data = image[first * BLOCK:(last + 1) * BLOCK]
+        span = f"{first}-{last}" if last != first else f"{first}"
+        lines.append(f'        <Range chksum="{hashlib.new(checksum_type, data).hexdigest()}"> {span} </Range>')
+    lines += ['    </BlockMap>', '</bmap>', '']
+    raw = "\n".join(lines).encode()
+    file_checksum = hashlib.new(checksum_type, raw).hexdigest()
+    raw = raw.replace(b"0" * digest_size, file_checksum.encode(), 1)
+    if corrupt:
+        raw = raw.replace(b"<BlockSize> 4096", b"<BlockSize> 8192")
+    path.write_bytes(raw)
+    return str(path)
+
+
+@pytest.fixture
+def image():
+    data = bytearray(10 * BLOCK + 100)
+    data[0:2 * BLOCK] = os.urandom(2 * BLOCK)
+    data[5 * BLOCK:6 * BLOCK] = os.urandom(BLOCK)
+    data[10 * BLOCK:] = os.urandom(100)
+    return bytes(data)
+
+
+def drain(reader):
+    """(offset, data) for every run an _ExtentReader returns"""
+    runs = []
+    buf = bytearray(3000)
+    with memoryview(buf) as view:
+        while True:
+            n = reader.readinto(view)
+            if not n:
+                return runs
+            runs.append((reader.offset, bytes(view[:n])))
+
+
+def test_parse_bmap(tmp_path, image):
+    bmap = parse_bmap(write_bmap(tmp_path / "image.bmap", image, [(0, 1), (5, 5), (10, 10)]))
+    assert (bmap.image_size, bmap.block_size, bmap.checksum_type) == (len(image), BLOCK, "sha256")
+    # The last range is clipped to the image size
+    assert [(start, length) for start, length, _ in bmap.ranges] == [(0, 2 * BLOCK), (5 * BLOCK, BLOCK),
+                                                                     (10 * BLOCK, 100)]
+    assert bmap.ranges[1][2] == hashlib.sha256(image[5 * BLOCK:6 * BLOCK]).hexdigest()
+
+
+def test_parse_bmap_version_1_defaults_to_sha1(tmp_path, image):
+    bmap = parse_bmap(write_bmap(tmp_path / "image.bmap", image, [(0, 1)], version="1.4"))
+    assert bmap.checksum_type == "sha1"
+
+
+def test_parse_bmap_rejects_corrupted_file(tmp_path, image):
+    with pytest.raises(FlashError, match="corrupted"):
+        parse_bmap(write_bmap(tmp_path / "image.bmap", image, [(0, 1)], corrupt=True))
+
+
+def test_parse_bmap_rejects_other_xml(tmp_path):
+    path = tmp_path / "other.xml"
+    path.write_text("<notbmap/>")
+    with pytest.raises(FlashError, match="Not a bmap"):
+        parse_bmap(str(path))
+
+
+class Unseekable(io.RawIOBase):
+    """A forward-only stream, like a decompressor's output"""
+
+    def __init__(self, data):
+        self._src = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, view):
+        return self._src.readinto(view)
+
+
+@pytest.mark.parametrize("wrap", [io.BytesIO, Unseekable])
+def test_extent_reader_returns_only_mapped_runs(wrap, image):
+    extents = [(0, 2 * BLOCK), (5 * BLOCK, BLOCK), (10 * BLOCK, 100)]
+    checksums = [hashlib.sha256(image[start:start + length]).hexdigest() for start, length in extents]
+    runs = drain(_ExtentReader(wrap(image), extents, checksums))
+    
+    assert b"".join(data for _, data in runs) == b"".join(image[s:s + n] for s, n in extents)
+    for offset, data in runs:
+        assert image[offset:offset + len(data)] == data
+        # A run never spans two extents
+        assert any(s <= offset and offset + len(data) <= s + n for s, n in extents)
+
+
+@pytest.mark.parametrize("wrap", [io.BytesIO, Unseekable])
+def test_extent_reader_checks_extent_checksums(wrap, image):
+    extents = [(0, 2 * BLOCK), (5 * BLOCK, BLOCK)]
+    checksums = [hashlib.sha256(image[:2 * BLOCK]).hexdigest(), "0" * 64]
+    with pytest.raises(FlashError, match="checksum mismatch"):
+        drain(_ExtentReader(wrap(image), extents, checksums))
+
+
+def test_extent_reader_short_image(image):
+    with pytest.raises(FlashError, match="Image ended"):
+        drain(_ExtentReader(Unseekable(image), [(0, BLOCK), (len(image) - 50, 100)]))
+
+
+def test_file_data_extents(tmp_path):
+    path = tmp_path / "sparse.img"
+    size = 4 * 1024 * 1024
+    with open(path, "wb") as f:
+        f.write(os.urandom(BLOCK))
+        f.seek(2 * 1024 * 1024)
+        f.write(os.urandom(BLOCK))
+        f.truncate(size)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        extents = _file_data_extents(fd, size)
+        assert os.lseek(fd, 0, os.SEEK_CUR) == 0
+    finally:
+        os.close(fd)
+    
+    def covered(offset):
+        return any(start <= offset < start + length for start, length in extents)
+    
+    assert covered(0) and covered(2 * 1024 * 1024)
+    assert all(0 <= start and start + length <= size for start, length in extents)
+    if extents != [(0, size)]:
+        # The filesystem reports holes: the unwritten middle is left out
+        assert not covered(1024 * 1024) and not covered(size - 1)
@@ -0,0 +1,125 @@
+"""Flashing from a URL and ranged downloads against a local HTTP server"""
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from flash import SafeISOFlasher, RangedDownloader, ChecksumCache, FlashJournal, FlashError, requests
+
+pytestmark = pytest.mark.skipif(requests is None, reason="requests is not installed")
+
+IMAGE = os.urandom(3 * 256 * 1024 + 1000)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves IMAGE with Range support; the server's settings inject faults"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _headers(self, status, start, end):
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"image-1"')
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(IMAGE)}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, 0, len(IMAGE))
+
+    def do_GET(self):
+        start, end, status = 0, len(IMAGE), 200
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match:
+            start, end, status = int(match.group(1)), int(match.group(2)) + 1, 206
+        self.server.ranges.append((start, end))
+        self._headers(status, start, end)
+        # Drop the connection part way through, as a flaky server would
+        cut = self.server.cut_after
+        if cut is not None and start <= cut < end:
+            self.server.cut_after = None
+            end = cut
+        self.wfile.write(IMAGE[start:end])
+        self.close_connection = True
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    httpd.ranges = []
+    httpd.cut_after = None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/image.iso"
+
+
+@pytest.fixture
+def device(tmp_path):
+    path = tmp_path / "device"
+    path.write_bytes(b"\0" * (len(IMAGE) + 4096))
+    return str(path)
+
+
+@pytest.fixture
+def flasher(tmp_path, device, monkeypatch):
+    flasher = SafeISOFlasher(use_sudo=False, checksum_cache=ChecksumCache(str(tmp_path / 'c.json')),
+                             flash_journal=FlashJournal(str(tmp_path / 'j.json')))
+    monkeypatch.setattr(flasher, "_prepare_target", lambda usb_device, image_size: "")
+    monkeypatch.setattr(flasher, "_get_device_size", lambda device_path: os.path.getsize(device))
+    yield flasher
+    flasher.close()
+
+
+def test_flash_from_url_with_cache(flasher, url, device, tmp_path):
+    cache_path = str(tmp_path / "image.iso")
+    result = flasher.flash_iso_from_url(url, device, cache_path=cache_path, sync_after=False)
+    assert result["success"], result["message"]
+    assert result["checksum_verified"]
+    assert result["bytes_written"] == len(IMAGE)
+    with open(device, "rb") as f:
+        assert f.read(len(IMAGE)) == IMAGE
+    with open(cache_path, "rb") as f:
+        assert f.read() == IMAGE
+    assert not os.path.exists(cache_path + ".part")
+
+
+def test_truncated_download_fails(flasher, server, url, device, tmp_path):
+    server.cut_after = len(IMAGE) // 2
+    cache_path = str(tmp_path / "image.iso")
+    result = flasher.flash_iso_from_url(url, device, cache_path=cache_path, sync_after=False)
+    assert not result["success"]
+    assert result["message"].startswith("Download incomplete")
+    assert not os.path.exists(cache_path)
+
+
+def test_ranged_download_resumes(server, url, tmp_path):
+    dest = str(tmp_path / "image.iso")
+    segment_size = 256 * 1024
+    server.cut_after = segment_size + 1000
+    session = requests.Session()
+    with pytest.raises(FlashError):
+        RangedDownloader(session, connections=2, segment_size=segment_size, chunk_size=4096,
+                         journal_interval=0).download(url, dest)
+    assert os.path.exists(dest + ".journal")
+
+    server.ranges.clear()
+    downloader = RangedDownloader(session, connections=2, segment_size=segment_size, chunk_size=4096)
+    assert downloader.download(url, dest) == len(IMAGE)
+    assert downloader.resumed
+    with open(dest, "rb") as f:
+        assert f.read() == IMAGE
+    assert not os.path.exists(dest + ".journal")
+    # Only what was missing is fetched again, starting where the cut segment stopped
+    assert (segment_size + 1000, 2 * segment_size) in server.ranges
+    assert sum(end - start for start, end in server.ranges) < len(IMAGE)
@@ -0,0 +1,106 @@
+"""USB disk detection against a fake sysfs tree"""
+import os
+
+import pytest
+
+from flash import SafeISOFlasher, DeviceMonitor, ChecksumCache, FlashJournal
+
+USB_HOST = "devices/pci0000:00/0000:00:14.0/usb1/1-1/1-1:1.0/host6/target6:0:0/6:0:0:0"
+SATA_HOST = "devices/pci0000:00/0000:00:17.0/ata1/host0/target0:0:0/0:0:0:0"
+
+
+class FakeSysfs:
+    """A minimal /sys with disks hanging off USB or SATA controllers"""
+
+    def __init__(self, root):
+        self.root = root
+        for bus in ("usb", "scsi"):
+            (root / "bus" / bus).mkdir(parents=True)
+        (root / "block").mkdir()
+        self.mountinfo = root / "mountinfo"
+        self.mountinfo.write_text("")
+
+    def _subsystem(self, node, bus):
+        os.symlink(os.path.relpath(self.root / "bus" / bus, node), node / "subsystem")
+
+    def add_disk(self, name, host, dev, usb=False, removable=False, sectors=2048, device_type="0"):
+        """Create a disk under the given host path and its /sys/block link"""
+        device = self.root / host
+        disk = device / "block" / name
+        disk.mkdir(parents=True, exist_ok=True)
+        if not (device / "subsystem").exists():
+            self._subsystem(device, "scsi")
+            (device / "type").write_text(device_type + "\n")
+            (device / "model").write_text("Disk\n")
+            (device / "vendor").write_text("ACME\n")
+        if usb:
+            node = device
+            while node.name != "usb1":
+                node = node.parent
+                if node.name.startswith(("usb", "1-")) and not (node / "subsystem").exists():
+                    self._subsystem(node, "usb")
+        os.symlink(os.path.relpath(device, disk), disk / "device")
+        (disk / "dev").write_text(dev + "\n")
+        (disk / "size").write_text(f"{sectors}\n")
+        (disk / "removable").write_text("1\n" if removable else "0\n")
+        (disk / "ro").write_text("0\n")
+        link = self.root / "block" / name
+        if os.path.lexists(link):
+            os.unlink(link)
+        os.symlink(os.path.relpath(disk, self.root / "block"), link)
+
+    def remove_disk(self, name):
+        os.unlink(self.root / "block" / name)
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    return FakeSysfs(tmp_path)
+
+
+@pytest.fixture
+def flasher(sysfs, tmp_path):
+    return SafeISOFlasher(sysfs_root=str(sysfs.root), mountinfo_path=str(sysfs.mountinfo),
+                          checksum_cache=ChecksumCache(str(tmp_path / 'c.json')),
+                          flash_journal=FlashJournal(str(tmp_path / 'j.json')))
+
+
+def test_usb_disk_is_detected(sysfs, flasher):
+    sysfs.add_disk("sdb", USB_HOST, "8:16", usb=True)
+    assert flasher._is_usb_device_linux("/dev/sdb")
+    assert flasher._usb_ancestor("sdb").endswith("1-1:1.0")
+    assert [device.device for device in flasher.list_usb_devices()] == ["/dev/sdb"]
+
+
+def test_sata_disk_is_not_usb(sysfs, flasher):
+    sysfs.add_disk("sda", SATA_HOST, "8:0")
+    assert not flasher._is_usb_device_linux("/dev/sda")
+    assert flasher.list_usb_devices() == []
+
+
+def test_optical_drive_is_not_listed(sysfs, flasher):
+    sysfs.add_disk("sr0", USB_HOST, "11:0", usb=True, removable=True, device_type="5")
+    assert flasher.list_usb_devices() == []
+
+
+def test_replaced_disk_is_not_taken_for_the_old_one(sysfs, flasher):
+    sysfs.add_disk("sdb", USB_HOST, "8:16", usb=True)
+    assert flasher._is_usb_device_linux("/dev/sdb")
+
+    # The stick goes away and a SATA disk takes over its name and major:minor
+    sysfs.remove_disk("sdb")
+    sysfs.add_disk("sdb", SATA_HOST, "8:16")
+    assert not flasher._is_usb_device_linux("/dev/sdb")
+    assert flasher.list_usb_devices() == []
+
+
+def test_monitor_removal_forgets_the_disk(sysfs, flasher):
+    sysfs.add_disk("sdb", USB_HOST, "8:16", usb=True)
+    monitor = DeviceMonitor(flasher, use_netlink=False, settle_timeout=0)
+    monitor.rescan()
+    assert flasher._usb_ancestors
+
+    sysfs.remove_disk("sdb")
+    monitor.handle_uevent(b"remove@/x\0ACTION=remove\0SUBSYSTEM=block\0DEVNAME=sdb\0DEVTYPE=disk\0")
+    assert monitor.devices == []
+    assert not flasher._usb_ancestors